@@ -1,8 +1,14 @@
 import streamlit as st
-from modules import coaching_app, biva_app # Nota: se bikefit è pronto, importa anche quello
+from modules import coaching_app, biva_app, write_queue # Nota: se bikefit è pronto, importa anche quello
+from modules.storage import start_queue
 
 st.set_page_config(page_title="AREA 199 HUB", layout="wide", page_icon="🔴")
 
+# Coda di scrittura attiva da subito (righe rimaste da un riavvio), una volta per processo
+queue_error = None
+try: start_queue()
+except Exception as e: queue_error = e
+
 # --- LOGIN ---
 if 'role' not in st.session_state:
     st.session_state['role'] = None
@@ -46,7 +52,32 @@ elif st.session_state['role'] == 'admin':
     if st.sidebar.button("LOGOUT"):
         st.session_state['role'] = None
         st.rerun()
-        
+
+    # Salvataggi ancora in coda verso Google Sheets (archivio BIVA, schede inviate)
+    try:
+        pending = write_queue.pending_count()
+        if pending: st.sidebar.caption(f"⏳ {pending} salvataggi in attesa di sincronizzazione")
+    except: pass
+
+    if queue_error: st.sidebar.warning(f"⚠️ Sincronizzazione salvataggi non avviata: {queue_error}")
+
+    # Salvataggi rifiutati da Google (errore non temporaneo): l'operatore li vede e decide
+    try: failed = write_queue.failed_rows()
+    except: failed = []
+    if failed:
+        st.sidebar.error(f"⚠️ {len(failed)} salvataggi non riusciti")
+        with st.sidebar.expander("DETTAGLI SALVATAGGI"):
+            for _, sh, ws, row, err, created in failed:
+                st.caption(f"{created[:16]} · {sh}/{ws} · {str(row[:3])[:80]}")
+                st.caption(f"Errore: {err}")
+            c_r, c_d = st.columns(2)
+            if c_r.button("🔁 RIPROVA"):
+                write_queue.retry_failed([f[0] for f in failed])
+                st.rerun()
+            if c_d.button("🗑️ SCARTA"):
+                write_queue.discard_failed([f[0] for f in failed])
+                st.rerun()
+
     if app_choice == "COACHING MANAGER":
         coaching_app.run_coach_dashboard()
         
@@ -1,10 +1,12 @@
 import streamlit as st
 from openai import OpenAI
 import os
+from modules.llm_cache import cached_completion
 
-def generate_ai_report(data_dict, patient_name):
+def generate_ai_report(data_dict, patient_name, force=False):
     """
     Versione 'UNIVERSALE' che legge la chiave 'openai_key' definita dall'utente.
+    Risposte in cache locale per prompt identici (force=True per rigenerare).
     """
     
     # --- 1. CACCIA ALLA CHIAVE (DEBUGGING) ---
@@ -51,14 +53,14 @@ def generate_ai_report(data_dict, patient_name):
         """
 
         # Chiamata API (Uso gpt-4o-mini o gpt-3.5-turbo che sono rapidi)
-        response = client.chat.completions.create(
+        return cached_completion(
+            client,
             model="gpt-3.5-turbo", 
             messages=[{"role": "user", "content": prompt}],
+            force=force,
             temperature=0.7,
             max_tokens=300
         )
-        
-        return response.choices[0].message.content
 
     except Exception as e:
         # Questo comando evita lo schermo nero e ti stampa l'errore rosso
@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import gspread
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+import streamlit as st
+from modules.local_db import open_db
+
+# ==============================================================================
+# BACKEND DI STORAGE
+# Stessa interfaccia "tabella" (righe numerate come nel foglio, riga 1 = intestazione)
+# sopra Google Sheets oppure sopra un database SQLite locale indicizzato.
+# Scelta: variabile d'ambiente AREA199_STORAGE o secrets [storage] backend = "sheets" | "sqlite".
+# ==============================================================================
+
+# Tutte le tabelle usate dall'HUB: (file, tab) - tab None = primo tab del modulo
+TABLES = [
+    ("AREA199_DB", "BIVA_LOGS"),
+    ("AREA199_DB", "SCHEDE_ATTIVE"),
+    ("AREA199_DB", "CLIENTI_ATTIVI"),
+    ("BIO ENTRY ANAMNESI", None),
+    ("BIO CHECK-UP", None),
+]
+
+def _storage_config():
+    try: conf = dict(st.secrets.get("storage", {}))
+    except Exception: conf = {}
+    if os.environ.get("AREA199_STORAGE"): conf["backend"] = os.environ["AREA199_STORAGE"]
+    return conf
+
+def _numericise(value):
+    """Come gspread.get_all_records: "12" -> 12, "1.5" -> 1.5, il resto resta testo ("1_000", " 12 " compresi)"""
+    if value == "" or "_" in value or any(c.isspace() for c in value): return value
+    try: return int(value)
+    except ValueError: pass
+    try: return float(value)
+    except ValueError: return value
+
+def _records(values):
+    if not values: return []
+    headers = values[0]
+    return [dict(zip(headers, [_numericise(v) for v in row])) for row in values[1:]]
+
+def _pad(rows):
+    """Righe rettangolari (come gspread.get_values)"""
+    width = max((len(r) for r in rows), default=0)
+    return [list(r) + [""] * (width - len(r)) for r in rows]
+
+# ------------------------------------------------------------------------------
+# GOOGLE SHEETS
+# ------------------------------------------------------------------------------
+
+@st.cache_resource
+def get_client():
+    """
+    Client gspread UNICO per processo (condiviso da tutte le sessioni).
+    Le credenziali restano in memoria: il token viene rinnovato solo alla scadenza,
+    e la sessione HTTP tiene le connessioni keep-alive verso Google.
+    """
+    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+    creds_dict = dict(st.secrets["gcp_service_account"])
+    creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
+    client = gspread.authorize(creds)
+
+    # Pool keep-alive più ampio (gspread 5: client.session / gspread 6: client.http_client.session)
+    # 4 host distinti: sheets, drive, oauth2, www.googleapis
+    session = getattr(client, 'session', None) or getattr(getattr(client, 'http_client', None), 'session', None)
+    if session is not None:
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        session.mount("https://", adapter)
+    return client
+
+@st.cache_resource
+def open_spreadsheet(title):
+    """Apre il foglio per titolo (AREA199_DB, BIO ENTRY ANAMNESI, BIO CHECK-UP) UNA volta sola per processo"""
+    return get_client().open(title)
+
+@st.cache_resource
+def open_worksheet(title, worksheet=None):
+    """Handle del tab (None = primo tab, come .sheet1) senza rileggere i metadati ad ogni rerun"""
+    sh = open_spreadsheet(title)
+    return sh.sheet1 if worksheet is None else sh.worksheet(worksheet)
+
+class SheetsTable:
+    def __init__(self, ws):
+        self.ws = ws
+
+    def get_all_values(self):
+        return self.ws.get_all_values()
+
+    def get_all_records(self):
+        return self.ws.get_all_records()
+
+    def get_values(self, start_row, end_row=None):
+        """Righe da start_row a end_row incluse (None = fino all'ultima)"""
+        return self.ws.get_values(f"A{start_row}:ZZ{end_row or ''}")
+
+    def col_values(self, col):
+        """Valori della colonna (1 = A), intestazione compresa"""
+        return self.ws.col_values(col)
+
+    def get_columns(self, cols, start_row=1):
+        """Solo le colonne richieste (1 = A) da start_row in giù, in UNA chiamata: lista di colonne"""
+        ranges = []
+        for col in cols:
+            letter = gspread.utils.rowcol_to_a1(1, col).rstrip("0123456789")
+            ranges.append(f"{letter}{start_row}:{letter}")
+        return [[r[0] if r else "" for r in vr] for vr in self.ws.batch_get(ranges)]
+
+    def set_headers(self, headers):
+        """Riscrive la riga di intestazione (allargando il tab se servono più colonne)"""
+        if self.ws.col_count < len(headers): self.ws.add_cols(len(headers) - self.ws.col_count)
+        self.ws.batch_update([{"range": "A1", "values": [list(headers)]}])
+
+    def append_rows(self, rows):
+        """Accoda le righe e ritorna il numero della prima riga scritta (None se la risposta non lo dice)"""
+        resp = self.ws.append_rows(rows)
+        # Le righe sono già scritte: un errore qui non deve far ritentare (e duplicare) l'append
+        try:
+            # es. "BIVA_LOGS!A12:I14" -> 12
+            cell = resp['updates']['updatedRange'].split('!')[-1].split(':')[0]
+            return int(''.join(c for c in cell if c.isdigit()))
+        except Exception:
+            return None
+
+class SheetsBackend:
+    name = "sheets"
+
+    def table(self, spreadsheet, worksheet=None):
+        return SheetsTable(open_worksheet(spreadsheet, worksheet))
+
+    def create_table(self, spreadsheet, worksheet, headers):
+        """Tab esistente, oppure nuovo tab con la riga di intestazione"""
+        sh = open_spreadsheet(spreadsheet)
+        try: return SheetsTable(sh.worksheet(worksheet))
+        except gspread.exceptions.WorksheetNotFound: pass
+        ws = sh.add_worksheet(title=worksheet, rows=1000, cols=len(headers))
+        ws.append_rows([headers])
+        return SheetsTable(ws)
+
+# ------------------------------------------------------------------------------
+# SQLITE LOCALE
+# ------------------------------------------------------------------------------
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS store_rows (
+    tbl TEXT NOT NULL,
+    row_num INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (tbl, row_num)
+);
+"""
+
+class SQLiteTable:
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+
+    def get_values(self, start_row, end_row=None):
+        with open_db(SQLITE_SCHEMA, self.backend.db_name) as conn:
+            cur = conn.execute("SELECT data FROM store_rows WHERE tbl = ? AND row_num >= ? AND row_num <= ? ORDER BY row_num",
+                               (self.name, start_row, end_row or sys.maxsize))
+            return _pad([json.loads(r[0]) for r in cur.fetchall()])
+
+    def get_all_values(self):
+        return self.get_values(1)
+
+    def get_all_records(self):
+        return _records(self.get_all_values())
+
+    def col_values(self, col):
+        values = [row[col - 1] if len(row) >= col else "" for row in self.get_all_values()]
+        while values and values[-1] == "": values.pop()
+        return values
+
+    def get_columns(self, cols, start_row=1):
+        rows = self.get_values(start_row)
+        out = []
+        for col in cols:
+            values = [row[col - 1] if len(row) >= col else "" for row in rows]
+            while values and values[-1] == "": values.pop()
+            out.append(values)
+        return out
+
+    def set_headers(self, headers):
+        with open_db(SQLITE_SCHEMA, self.backend.db_name) as conn:
+            conn.execute("INSERT OR REPLACE INTO store_rows (tbl, row_num, data) VALUES (?, 1, ?)",
+                         (self.name, json.dumps([str(h) for h in headers])))
+
+    def append_rows(self, rows):
+        rows = [["" if v is None else str(v) for v in row] for row in rows]
+        with open_db(SQLITE_SCHEMA, self.backend.db_name) as conn:
+            conn.execute("BEGIN IMMEDIATE") # Serializza gli append anche tra processi diversi
+            last = conn.execute("SELECT MAX(row_num) FROM store_rows WHERE tbl = ?", (self.name,)).fetchone()[0] or 0
+            conn.executemany("INSERT INTO store_rows (tbl, row_num, data) VALUES (?, ?, ?)",
+                             [(self.name, last + 1 + i, json.dumps(r)) for i, r in enumerate(rows)])
+        return last + 1
+
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(self, db_name="store.sqlite"):
+        self.db_name = db_name
+
+    def table(self, spreadsheet, worksheet=None):
+        return SQLiteTable(self, f"{spreadsheet}/{worksheet or ''}")
+
+    def create_table(self, spreadsheet, worksheet, headers):
+        table = self.table(spreadsheet, worksheet)
+        if not table.get_values(1, 1): table.append_rows([headers])
+        return table
+
+# ------------------------------------------------------------------------------
+# SELEZIONE
+# ------------------------------------------------------------------------------
+
+@st.cache_resource
+def get_backend():
+    conf = _storage_config()
+    if conf.get("backend") == "sqlite":
+        return SQLiteBackend(conf.get("path", "store.sqlite"))
+    return SheetsBackend()
+
+def sync_to_sheets():
+    """Con backend SQLite: True se le scritture vanno replicate anche su Google Sheets"""
+    return bool(_storage_config().get("sync_to_sheets", False))
+
+def copy_tables(source, target, tables=TABLES):
+    """Copia le tabelle da un backend all'altro (es. Sheets -> SQLite per lavorare/testare offline)"""
+    for spreadsheet, worksheet in tables:
+        dest = target.table(spreadsheet, worksheet)
+        if dest.get_values(1, 1):
+            print(f"{spreadsheet}/{worksheet or ''}: già presente, saltata")
+            continue
+        values = source.table(spreadsheet, worksheet).get_all_values()
+        if values: dest.append_rows(values)
+        print(f"{spreadsheet}/{worksheet or ''}: {len(values)} righe")
+
+if __name__ == "__main__":
+    # python -m modules.backends store.sqlite  ->  copia locale di tutte le tabelle dell'HUB
+    copy_tables(SheetsBackend(), SQLiteBackend(sys.argv[1] if len(sys.argv) > 1 else "store.sqlite"))
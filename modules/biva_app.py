@@ -9,8 +9,10 @@ import requests
 import openai
 from PIL import Image
 from modules.calculations import calculate_advanced_metrics
+from modules.biva_reference import ellipses, describe, applicable, LEVELS, MIN_AGE, REFERENCE_LABEL
 from modules.pdf_engine import BivaReportPDF
-from modules.storage import get_patient_history, save_visit
+from modules.storage import get_patient_history, save_visit, suggest_patients
+from modules.llm_cache import cached_stream
 
 # --- FUNZIONE PULIZIA TESTO (ADDIO ASTERISCHI) ---
 def clean_markdown(text):
@@ -18,6 +20,23 @@ def clean_markdown(text):
     if not text: return ""
     return text.replace('**', '').replace('__', '').replace('###', '').replace('##', '').replace('#', '')
 
+MARKDOWN_MARKS = "*_#"
+
+def clean_markdown_stream(chunks):
+    """
+    clean_markdown applicato mentre il testo arriva. I simboli in coda restano in attesa
+    del pezzo successivo (un '*' potrebbe diventare '**'): il risultato unito è identico
+    a clean_markdown del testo completo.
+    """
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        cut = len(pending.rstrip(MARKDOWN_MARKS))
+        if cut:
+            yield clean_markdown(pending[:cut])
+            pending = pending[cut:]
+    if pending: yield clean_markdown(pending)
+
 # --- FUNZIONI GRAFICHE ---
 def draw_body_map(pha_dx, pha_sx):
     fig, ax = plt.subplots(figsize=(4, 6))
@@ -43,9 +62,12 @@ def draw_body_map(pha_dx, pha_sx):
     return fig
 
 # --- DIAGNOSI CLINICA (PROMPT ORIGINALE INTEGRALE + STORICO) ---
-def run_clinical_diagnosis(data, name, subject_type, gender, age, weight, height, clinical_notes, data_sx=None, history=None):
+def stream_clinical_diagnosis(data, name, subject_type, gender, age, weight, height, clinical_notes, data_sx=None, history=None, force=False):
+    """Referto a pezzi, già ripuliti, man mano che gpt-4o li scrive (da cache: tutto in un pezzo)"""
     key = st.secrets.get("openai_key") or st.secrets.get("openai", {}).get("api_key")
-    if not key: return "Errore API Key."
+    if not key:
+        yield "Errore API Key."
+        return
 
     try:
         client = openai.Client(api_key=key)
@@ -160,18 +182,25 @@ def run_clinical_diagnosis(data, name, subject_type, gender, age, weight, height
         [Dai 3 direttive pratiche.]
         """
         
-        response = client.chat.completions.create(
+        # Stesso prompt già elaborato -> risposta dalla cache locale (force = nuova chiamata)
+        chunks = cached_stream(
+            client,
             model="gpt-4o",
             messages=[{"role": "user", "content": prompt}],
+            force=force,
             temperature=0.7,
             max_tokens=1200
         )
         
         # >>> PULIZIA ASTERISCHI <<<
-        return clean_markdown(response.choices[0].message.content)
+        yield from clean_markdown_stream(chunks)
         
     except Exception as e:
-        return f"Errore generazione: {str(e)}"
+        yield f"Errore generazione: {str(e)}"
+
+def run_clinical_diagnosis(*args, **kwargs):
+    """Referto completo in un'unica stringa (stessi argomenti di stream_clinical_diagnosis)"""
+    return "".join(stream_clinical_diagnosis(*args, **kwargs))
 
 # --- FUNZIONE PRINCIPALE APP ---
 def run_biva():
@@ -220,12 +249,29 @@ def run_biva():
             st.session_state['history'] = get_patient_history(name)
         except:
             st.session_state['history'] = None
+        # Nessuno storico col nome esatto: nomi simili SOLO come proposta, l'operatore conferma
+        hist = st.session_state['history']
+        st.session_state['history_suggestions'] = suggest_patients(name) if hist is None or hist.empty else []
 
     if st.session_state.get('analyzed'):
         d = st.session_state['data']
         d_sx = st.session_state.get('data_sx')
         hist = st.session_state.get('history')
         
+        suggestions = st.session_state.get('history_suggestions')
+        if suggestions:
+            st.warning(f"Nessuno storico per '{name}'. In archivio ci sono nomi simili: è lo stesso paziente?")
+            c_sug, c_ok, c_no = st.columns([2, 1, 1])
+            choice = c_sug.selectbox("Paziente in archivio", suggestions, label_visibility="collapsed")
+            if c_ok.button("✅ USA QUESTO STORICO"):
+                st.session_state['history'] = get_patient_history(choice)
+                st.session_state['history_suggestions'] = []
+                st.session_state['diagnosis'] = None
+                st.rerun()
+            if c_no.button("❌ PAZIENTE NUOVO"):
+                st.session_state['history_suggestions'] = []
+                st.rerun()
+
         st.title(f"ANALISI: {name}")
         st.caption(f"Ref: Dott. Petruzzi | Profilo: {subject_type} | Note: {clinical_notes}")
         
@@ -272,6 +318,10 @@ def run_biva():
             with c_g1:
                 fig_biva, ax = plt.subplots(figsize=(4, 5))
                 fig_biva.patch.set_facecolor('white'); ax.set_facecolor('white')
+                # Ellissi di tolleranza della popolazione di riferimento (precalcolate, solo adulti)
+                if applicable(age):
+                    for level, contour, style in zip(LEVELS, ellipses(gender), [':', '--', '-']):
+                        ax.plot(contour[:, 0], contour[:, 1], color='#888888', linestyle=style, linewidth=0.8, label=f"{level:.0%}")
                 ax.scatter(d['Rz']/(h/100), d['Xc']/(h/100), c='red', s=100, label="DX", edgecolor='black')
                 if d_sx: ax.scatter(d_sx['Rz']/(h/100), d_sx['Xc']/(h/100), c='cyan', s=80, label="SX", edgecolor='black')
                 if hist is not None and not hist.empty:
@@ -287,6 +337,11 @@ def run_biva():
                 ax.set_xlabel("R/H (Ohm/m)", fontsize=8); ax.set_ylabel("Xc/H (Ohm/m)", fontsize=8)
                 ax.legend(fontsize=8)
                 st.pyplot(fig_biva)
+                if applicable(age):
+                    st.caption(f"DX: {describe(d['Rz']/(h/100), d['Xc']/(h/100), gender, age)}")
+                    if d_sx: st.caption(f"SX: {describe(d_sx['Rz']/(h/100), d_sx['Xc']/(h/100), gender, age)}")
+                else:
+                    st.warning(f"Età sotto i {MIN_AGE} anni: ellissi e classificazione non mostrate (rif. {REFERENCE_LABEL}).")
             
             with c_g2:
                 fig_bars, ax2 = plt.subplots(figsize=(4, 5))
@@ -310,18 +365,20 @@ def run_biva():
             else:
                 st.info("Clicca per generare il referto.")
             
+            force_report = st.checkbox("🔁 Forza rigenerazione (ignora referto in cache)", key="force_report")
             if st.button("ELABORA REFERTO COMPLETO"):
-                with st.spinner("Analisi fisiologica profonda (Confronto Storico Attivo)..."):
-                    res = run_clinical_diagnosis(d, name, subject_type, gender, age, w, h, clinical_notes, d_sx, hist)
-                    st.session_state['diagnosis'] = res
-                    st.rerun()
+                # Il testo compare mentre viene scritto; a fine stream si salva e si ridisegna la pagina
+                st.caption("Analisi fisiologica profonda (Confronto Storico Attivo)...")
+                res = st.write_stream(stream_clinical_diagnosis(d, name, subject_type, gender, age, w, h, clinical_notes, d_sx, hist, force=force_report))
+                st.session_state['diagnosis'] = res if isinstance(res, str) else "".join(map(str, res))
+                st.rerun()
 
         st.markdown("---")
         c_s, c_p = st.columns(2)
         with c_s:
             if st.button("💾 ARCHIVIA"):
                 try:
-                    save_visit(name, w, rz, xc, d['PhA'], d['TBW_L'], d['FM_perc'], d['FFM_kg'])
+                    save_visit(name, w, rz, xc, d['PhA'], d['TBW_L'], d['FM_perc'], d['FFM_kg'], height=h, age=age, gender=gender)
                     st.success("OK")
                 except: st.error("Errore DB")
         
@@ -345,6 +402,8 @@ def run_biva():
                     pdf_data['Weight'] = w
                     pdf_data['Rz'] = rz
                     pdf_data['Xc'] = xc
+                    pdf_data['BIVA_Class'] = f"Vettore DX: {describe(rz/(h/100), xc/(h/100), gender, age)}"
+                    if d_sx: pdf_data['BIVA_Class'] += f"\nVettore SX: {describe(d_sx['Rz']/(h/100), d_sx['Xc']/(h/100), gender, age)}"
                     
                     pdf_data['Report_Text'] = st.session_state.get('diagnosis', "")
                     
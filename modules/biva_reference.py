@@ -0,0 +1,78 @@
+import numpy as np
+
+# ==============================================================================
+# ELLISSI DI TOLLERANZA BIVA (RIFERIMENTO NORMATIVO R/H - Xc/H)
+# Parametri della popolazione di riferimento per sesso in UN array; i contorni
+# 50/75/95% si calcolano una volta all'import (non a ogni render) e la
+# classificazione dei punti (distanza di Mahalanobis -> percentile) è vettoriale.
+# Riferimento solo adulti: sotto i 18 anni nessuna classificazione.
+# ==============================================================================
+
+SEXES = ("M", "F")
+PARAM_FIELDS = ("mean_r", "mean_xc", "sd_r", "sd_xc", "corr")
+REFERENCE_LABEL = "adulti (Piccoli 1995)"
+MIN_AGE = 18
+
+# Adulti italiani (Piccoli 1995), R/H e Xc/H in Ohm/m
+PARAMS = np.array([
+    [298.6, 34.0, 43.2, 7.7, 0.63], # M
+    [371.9, 34.4, 50.3, 7.7, 0.58], # F
+])
+
+LEVELS = np.array([0.50, 0.75, 0.95])
+CHI2_2DOF = -2.0 * np.log(1.0 - LEVELS) # 1.386, 2.773, 5.991
+ELLIPSE_POINTS = 120
+
+def _covariances(params):
+    sd_r, sd_xc, corr = params[..., 2], params[..., 3], params[..., 4]
+    cov = np.empty(params.shape[:-1] + (2, 2))
+    cov[..., 0, 0] = sd_r ** 2
+    cov[..., 1, 1] = sd_xc ** 2
+    cov[..., 0, 1] = cov[..., 1, 0] = corr * sd_r * sd_xc
+    return cov
+
+def _contours(params, cov):
+    """Contorni di tutte le ellissi: (sesso, livello, punto, [R/H, Xc/H])"""
+    theta = np.linspace(0.0, 2.0 * np.pi, ELLIPSE_POINTS)
+    circle = np.stack([np.cos(theta), np.sin(theta)], axis=-1) # (punto, 2)
+    chol = np.linalg.cholesky(cov) # (sesso, 2, 2)
+    radius = np.sqrt(CHI2_2DOF)[None, :, None, None]
+    shape = np.einsum("sij,pj->spi", chol, circle)[:, None] # (sesso, 1, punto, 2)
+    return (params[:, None, None, :2] + radius * shape).astype(np.float32)
+
+COVARIANCES = _covariances(PARAMS)
+INVERSES = np.linalg.inv(COVARIANCES)
+ELLIPSES = _contours(PARAMS, COVARIANCES)
+
+ZONES = ("entro il 50%", "50-75%", "75-95%", "oltre il 95%")
+
+def _sex_index(gender):
+    return np.where(np.char.upper(np.asarray(gender, dtype=str)) == "F", 1, 0)
+
+def applicable(age):
+    """Il riferimento vale solo per gli adulti"""
+    return np.asarray(age, dtype=float) >= MIN_AGE
+
+def ellipses(gender):
+    """Contorni 50/75/95% per sesso: array (livello, punto, 2)"""
+    return ELLIPSES[int(_sex_index(gender))]
+
+def classify(r_h, xc_h, gender):
+    """
+    Punti (R/H, Xc/H) -> (distanza di Mahalanobis², percentile, zona).
+    Accetta scalari o array della stessa lunghezza; percentile = quota della popolazione
+    di riferimento più vicina al centro (chi² a 2 gradi di libertà). L'età va filtrata con applicable().
+    """
+    sex = _sex_index(gender)
+    delta = np.stack([np.asarray(r_h, dtype=float), np.asarray(xc_h, dtype=float)], axis=-1) - PARAMS[sex, :2]
+    d2 = np.einsum("...i,...ij,...j->...", delta, INVERSES[sex], delta)
+    percentile = 100.0 * (1.0 - np.exp(-d2 / 2.0))
+    zone = np.take(ZONES, np.searchsorted(CHI2_2DOF, d2))
+    return d2, percentile, zone
+
+def describe(r_h, xc_h, gender, age):
+    """Testo breve per grafico e PDF (sotto i 18 anni: classificazione non disponibile)"""
+    if not applicable(age):
+        return f"classificazione non disponibile sotto i {MIN_AGE} anni - rif. {REFERENCE_LABEL}"
+    _, percentile, zone = classify(r_h, xc_h, gender)
+    return f"Ellisse {zone} (percentile {float(percentile):.0f}) - rif. {SEXES[int(_sex_index(gender))]} {REFERENCE_LABEL}"
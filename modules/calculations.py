@@ -1,4 +1,10 @@
 import math
+import numpy as np
+import pandas as pd
+
+# Da aumentare ad ogni modifica delle formule: il ricalcolo dell'archivio (modules.reprocess)
+# scrive un tab derivato per versione
+FORMULA_VERSION = "v1"
 
 def calculate_advanced_metrics(rz, xc, height_cm, weight_kg, age, gender):
     """
@@ -62,3 +68,84 @@ def calculate_advanced_metrics(rz, xc, height_cm, weight_kg, age, gender):
         "ECW_L": round(ecw, 1), "ICW_L": round(icw, 1),
         "BMR_kcal": int(bmr)
     }
+
+# ==============================================================================
+# VERSIONE A COLONNE (coorti, storici, ricalcolo archivio)
+# Stesse formule e stesso ordine delle operazioni di calculate_advanced_metrics:
+# risultati identici riga per riga, compresi arrotondamenti e troncamento del BMR.
+# ==============================================================================
+
+INVALID_KEYS = ["PhA", "TBW_L", "ECW_L", "ICW_L", "BCM_kg", "FM_perc", "FFM_kg"]
+_atan = np.frompyfunc(math.atan, 1, 1) # math.atan e non np.arctan: quest'ultimo può differire di 1 ULP
+
+def _round(values, digits):
+    """round() di Python su array: np.round ovunque, round() solo sui casi a metà (x.xx5) dove i due divergono"""
+    out = np.round(values, digits)
+    scaled = np.abs(values) * 10.0 ** digits
+    tie = np.isfinite(scaled) & (np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    if tie.any(): out[tie] = [round(v, digits) for v in values[tie].tolist()]
+    return out
+
+def calculate_advanced_metrics_batch(rz, xc, height_cm, weight_kg, age, gender):
+    """
+    calculate_advanced_metrics su colonne (array, liste o Series della stessa lunghezza; gli scalari
+    valgono come colonna di una riga o si ripetono su tutte).
+    Ritorna un DataFrame con le stesse chiavi; le righe non valide (Rz, altezza o peso <= 0)
+    hanno 0 nelle 7 chiavi del caso di errore e NaN nelle altre (colonna 'valid' = False).
+    """
+    rz = np.atleast_1d(np.asarray(rz, dtype=float))
+    xc = np.atleast_1d(np.asarray(xc, dtype=float))
+    height_cm = np.atleast_1d(np.asarray(height_cm, dtype=float))
+    weight_kg = np.atleast_1d(np.asarray(weight_kg, dtype=float))
+    age = np.atleast_1d(np.asarray(age, dtype=float))
+    male = np.atleast_1d(np.asarray(gender, dtype=object) == "M")
+    rz, xc, height_cm, weight_kg, age, male = np.broadcast_arrays(rz, xc, height_cm, weight_kg, age, male)
+
+    valid = (rz > 0) & (height_cm > 0) & (weight_kg > 0)
+    # Righe non valide: valori neutri solo per non generare warning, poi sovrascritte
+    rz_s = np.where(valid, rz, 1.0)
+    h_s = np.where(valid, height_cm, 1.0)
+    w_s = np.where(valid, weight_kg, 1.0)
+
+    h_m = h_s / 100.0
+    bmi = w_s / (h_m ** 2)
+    pha = np.asarray(_atan(xc / rz_s), dtype=float) * (180.0 / math.pi) # = math.degrees
+    h2_rz = (h_s ** 2) / rz_s
+
+    tbw = np.where(male, 1.2 + (0.45 * h2_rz) + (0.18 * w_s), 3.75 + (0.45 * h2_rz) + (0.11 * w_s))
+    ecw = np.where(male, 0.065 * h2_rz + 0.177 * w_s - 2.5, 0.065 * h2_rz + 0.150 * w_s - 1.8)
+    ffm = np.where(male, -10.68 + (0.65 * h2_rz) + (0.26 * w_s) + (0.02 * rz_s),
+                   -9.53 + (0.69 * h2_rz) + (0.17 * w_s) + (0.02 * rz_s))
+
+    # SAFETY CHECK ACQUA (in sequenza, come nella versione scalare)
+    ecw = np.where((tbw > 0) & (ecw < tbw * 0.30), tbw * 0.35, ecw)
+    ecw = np.where((tbw > 0) & (ecw > tbw * 0.55), tbw * 0.50, ecw)
+    icw = tbw - ecw
+
+    ffm = np.where(ffm > w_s * 0.98, w_s * 0.98, ffm)
+    fm = w_s - ffm
+    fm = np.where(fm < 0, 0, fm)
+    fm_perc = (fm / w_s) * 100
+    ffm_perc = (ffm / w_s) * 100
+
+    smm = (0.401 * h2_rz) + (3.825 * male.astype(int)) - (0.071 * age) + 5.102
+    bcm = ffm * (0.50 + (0.02 * (pha - 5.0)))
+    bmr = 500 + (22 * ffm)
+
+    out = pd.DataFrame({
+        "Rz": rz, "Xc": xc, "PhA": _round(pha, 2), "BMI": _round(bmi, 1),
+        "FFM_kg": _round(ffm, 1), "FFM_perc": _round(ffm_perc, 1),
+        "FM_kg": _round(fm, 1), "FM_perc": _round(fm_perc, 1),
+        "BCM_kg": _round(bcm, 1), "SMM_kg": _round(smm, 1),
+        "TBW_L": _round(tbw, 1), "TBW_perc": _round((tbw / w_s) * 100, 1),
+        "ECW_L": _round(ecw, 1), "ICW_L": _round(icw, 1),
+        "BMR_kcal": np.trunc(bmr),
+    })
+    invalid = ~valid
+    if invalid.any():
+        out.loc[invalid, :] = np.nan
+        out.loc[invalid, INVALID_KEYS] = 0
+    else:
+        out["BMR_kcal"] = out["BMR_kcal"].astype(np.int64)
+    out["valid"] = valid
+    return out
@@ -1,27 +1,28 @@
 import streamlit as st
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
 import json
-import re
-import ast
 from datetime import datetime
 import openai
-import requests
-import matplotlib.pyplot as plt
-from rapidfuzz import process, fuzz
-import base64
+from concurrent.futures import ThreadPoolExecutor
+from modules.storage import get_table, get_latest_plan, save_plan
+from modules.roster import Roster
+from modules.subscriptions import SubscriptionMap
+from modules.exercise_catalog import ExerciseCatalog
+from modules.exercise_matcher import ExerciseMatcher, resolve_plan_images
+from modules.exercise_search import ExerciseSearchIndex
+from modules.image_cache import image_source, prefetch
+from modules.exercise_matcher import BASE_URL
+from modules.ingest import resolve_columns, to_number_column, to_datetime_column
+from modules.llm_cache import cached_completion
+from modules.workout_parser import parse_workout, fill_search_names
+from modules.plan_export import workout_export, diet_export
+from modules.plan_model import parse_plan, parse_diet, normalize_plan, normalize_diet
+from modules.metrics_engine import analyze
 
 # ==============================================================================
 # 1. MOTORE DATI
 # ==============================================================================
 
-def get_client():
-    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    creds_dict = dict(st.secrets["gcp_service_account"])
-    creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-    return gspread.authorize(creds)
-
 def clean_json_response(text):
     if not text: return "{}"
     try:
@@ -33,247 +34,277 @@ def clean_json_response(text):
         return text
     except: return text
 
-def clean_num(val):
-    if not val: return 0.0
-    s = str(val).lower().replace(',', '.').replace('kg', '').replace('cm', '').strip()
-    try: 
-        match = re.search(r"[-+]?\d*\.\d+|\d+", s)
-        return float(match.group()) if match else 0.0
-    except: return 0.0
-
-def normalize_key(key):
-    return re.sub(r'[^a-zA-Z0-9]', '', str(key).lower())
-
-def get_val(row, keywords, is_num=False):
-    row_norm = {normalize_key(k): v for k, v in row.items()}
-    for kw in keywords:
-        kw_norm = normalize_key(kw)
-        for k_row, v_row in row_norm.items():
-            if kw_norm in k_row:
-                if is_num: return clean_num(v_row)
-                return str(v_row).strip()
-    return 0.0 if is_num else ""
+METRICS_MAP = {
+    "Peso": ["Peso"], "Collo": ["Collo"], "Torace": ["Torace"], "Addome": ["Addome"], "Fianchi": ["Fianchi"],
+    "Braccio Sx": ["Braccio Sx"], "Braccio Dx": ["Braccio Dx"],
+    "Coscia Sx": ["Coscia Sx"], "Coscia Dx": ["Coscia Dx"],
+    "Polpaccio Sx": ["Polpaccio Sx"], "Polpaccio Dx": ["Polpaccio Dx"]
+}
+
+# Moduli compilati dagli atleti: (file, etichetta sorgente). I nuovi moduli si aggiungono qui.
+FORM_SHEETS = [("BIO ENTRY ANAMNESI", "ANAMNESI"), ("BIO CHECK-UP", "CHECKUP")]
+
+# Pool condiviso da tutte le sessioni: limita le chiamate contemporanee verso Google
+FETCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="area199-fetch")
+
+def form_entries(records, clean_email, source):
+    """Righe del modulo per un'email -> voci storico. Intestazioni risolte una volta, numeri puliti per colonna."""
+    df = pd.DataFrame(records)
+    if df.empty: return []
+
+    email_col = 'E-mail' if 'E-mail' in df.columns else ('Email' if 'Email' in df.columns else None)
+    if not email_col: return []
+    df = df[df[email_col].astype(str).str.strip().str.lower() == clean_email]
+    if df.empty: return []
+
+    out = pd.DataFrame(index=df.index)
+    out['Date'] = df['Submitted at'] if 'Submitted at' in df.columns else '01/01/2000'
+    out['Source'] = source
+    for label, col in resolve_columns(df.columns, METRICS_MAP).items():
+        out[label] = to_number_column(df[col]).values if col is not None else 0.0
+    return out.to_dict('records')
 
 def get_full_history(email):
-    client = get_client()
-    history = []
+    """
+    Storico misure da tutti i moduli, scaricati IN PARALLELO (tempo = modulo più lento, non la somma).
+    Ritorna le voci ordinate per data, con 'Date_parsed' (datetime o None se la data è illeggibile).
+    """
     clean_email = str(email).strip().lower()
 
-    metrics_map = {
-        "Peso": ["Peso"], "Collo": ["Collo"], "Torace": ["Torace"], "Addome": ["Addome"], "Fianchi": ["Fianchi"],
-        "Braccio Sx": ["Braccio Sx"], "Braccio Dx": ["Braccio Dx"],
-        "Coscia Sx": ["Coscia Sx"], "Coscia Dx": ["Coscia Dx"],
-        "Polpaccio Sx": ["Polpaccio Sx"], "Polpaccio Dx": ["Polpaccio Dx"]
-    }
+    # Tabelle risolte qui (cache Streamlit nel thread principale), solo il download va nel pool
+    tables = []
+    for title, source in FORM_SHEETS:
+        try: tables.append((get_table(title), source))
+        except: pass
 
-    try:
-        sh = client.open("BIO ENTRY ANAMNESI").sheet1
-        for r in sh.get_all_records():
-            if str(r.get('E-mail', r.get('Email',''))).strip().lower() == clean_email:
-                entry = {'Date': r.get('Submitted at', '01/01/2000'), 'Source': 'ANAMNESI'}
-                for label, kws in metrics_map.items(): entry[label] = get_val(r, kws, True)
-                history.append(entry)
-    except: pass
+    def fetch(item):
+        table, source = item
+        try: return form_entries(table.get_all_records(), clean_email, source)
+        except: return []
 
-    try:
-        sh = client.open("BIO CHECK-UP").sheet1
-        for r in sh.get_all_records():
-            if str(r.get('E-mail', r.get('Email',''))).strip().lower() == clean_email:
-                entry = {'Date': r.get('Submitted at', '01/01/2000'), 'Source': 'CHECKUP'}
-                for label, kws in metrics_map.items(): entry[label] = get_val(r, kws, True)
-                history.append(entry)
-    except: pass
+    history = [entry for entries in FETCH_POOL.map(fetch, tables) for entry in entries]
+    if not history: return history
 
+    parsed = to_datetime_column([h['Date'] for h in history])
+    for entry, dt in zip(history, parsed):
+        entry['Date_parsed'] = None if pd.isna(dt) else dt.to_pydatetime()
+    history.sort(key=lambda h: h['Date_parsed'] or datetime.min)
     return history
 
+@st.cache_data(max_entries=64, show_spinner=False)
+def analyze_history(history):
+    """Tabelle del pannello CONTROLLO e dei grafici trend, calcolate una volta per storico"""
+    return analyze(history, list(METRICS_MAP))
+
+@st.cache_resource
+def get_roster():
+    """Roster atleti condiviso da tutte le sessioni (solo email/nome, aggiornamento incrementale)"""
+    return Roster()
+
+@st.cache_resource
+def get_subscriptions():
+    """Mappa abbonamenti condivisa da tutte le sessioni (riletta ogni pochi minuti o su richiesta)"""
+    return SubscriptionMap()
+
 # ==============================================================================
 # 2. MOTORE AI & IMMAGINI
 # ==============================================================================
-@st.cache_data(ttl=3600)
+@st.cache_resource
+def get_exercise_catalog():
+    """Catalogo esercizi condiviso da tutte le sessioni (snapshot su disco, refresh in background)"""
+    return ExerciseCatalog()
+
 def load_exercise_db():
-    try: 
-        resp = requests.get("https://raw.githubusercontent.com/yuhonas/free-exercise-db/main/dist/exercises.json", timeout=20)
-        if resp.status_code == 200:
-            data = resp.json()
-            return sorted(data, key=lambda x: x['name'])
-        return []
-    except: return []
-
-def find_exercise_images(name_query, db_exercises):
-    if not db_exercises or not name_query: return ([], "DB/Query Vuota")
-    BASE_URL = "https://raw.githubusercontent.com/yuhonas/free-exercise-db/main/exercises/"
-    q = name_query.lower().strip()
-
-    synonyms = {
-        "lying leg curl": "lying leg curls",
-        "leg curl": "lying leg curls",
-        "leg extension": "leg extensions",
-        "leg press": "leg press",
-        "calf raise": "calf raise",
-        "hip adduction": "adductor",
-        "adduction": "adductor",
-        "reverse pec deck": "reverse fly",
-        "t-bar": "t-bar",
-        "lat pulldown": "pulldown",
-        "straight arm": "straight-arm pulldown",
-        "cable row": "seated cable row",
-        "hyperextension": "hyperextension",
-        "pec deck": "butterfly",
-        "chest press": "chest press",
-        "face pull": "face pull",
-        "lateral raise": "lateral raise",
-        "pushdown": "pushdown",
-        "triceps pushdown": "pushdown",
-        "preacher curl": "preacher curl",
-        "overhead cable": "overhead triceps",
-        "side plank": ["side plank", "side bridge"],
-        "plank": "plank",
-        "dead bug": "dead bug",
-        "vacuum": "stomach vacuum"
-    }
-
-    search_terms = [q] 
-    for key in sorted(synonyms.keys(), key=len, reverse=True):
-        if key in q:
-            val = synonyms[key]
-            if isinstance(val, list): search_terms = val
-            else: search_terms = [val]
-            break
-
-    for term in search_terms:
-        candidates = []
-        for ex in db_exercises:
-            if term.lower() in ex['name'].lower():
-                candidates.append(ex)
-        if candidates:
-            best = min(candidates, key=lambda x: len(x['name']))
-            return ([BASE_URL + i for i in best.get('images', [])], f"Synonym: '{term}' -> {best['name']}")
-
-    db_names = [x['name'] for x in db_exercises]
-    match = process.extractOne(q, db_names, scorer=fuzz.token_set_ratio)
+    return get_exercise_catalog().get()
+
+BROWSER_PAGE_SIZE = 8 # Card per pagina nel browser (2 righe da 4): solo queste caricano le foto
+
+@st.cache_resource(max_entries=2)
+def get_exercise_search_index(version):
+    """Indice di ricerca del browser, costruito UNA volta per versione del catalogo"""
+    return ExerciseSearchIndex(get_exercise_catalog().get())
+
+@st.cache_resource(max_entries=2)
+def get_exercise_matcher(version):
+    """Indice di abbinamento foto, costruito UNA volta per versione del catalogo"""
+    return ExerciseMatcher(get_exercise_catalog().get())
+
+LLM_TIMEOUT = 120 # Secondi massimi per ogni singola richiesta a OpenAI
+LLM_RETRIES = 2   # Ritentativi dell'SDK su 429, 5xx ed errori di connessione (come il default)
+LLM_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="area199-llm")
+
+def workout_prompt(raw_workout, note_workout):
+    return f"""
+    Agisci come un parser JSON "FOTOCOPIATRICE".
     
-    if match and match[1] > 65:
-        bad_words = ["press", "fly", "row", "curl", "squat", "deadlift"]
-        is_safe = True
-        cand_name = match[0].lower()
-        for w in bad_words:
-            if (w in q and w not in cand_name) or (w not in q and w in cand_name):
-                is_safe = False
-                if "bench press" in cand_name and "chest press" in q: is_safe = True 
-        
-        if is_safe:
-            for ex in db_exercises:
-                if ex['name'] == match[0]:
-                    return ([BASE_URL + i for i in ex.get('images', [])], f"Fuzzy: {match[0]} ({match[1]}%)")
+    INPUT UTENTE:
+    {raw_workout}
+    
+    NOTE COACH:
+    {note_workout}
+    
+    REGOLA SUPREMA: NON TRADURRE NULLA.
+    Se l'input è in Italiano, l'output DEVE ESSERE IN ITALIANO.
+    Copia 'details' e 'note' ESATTAMENTE come scritti dall'utente, parola per parola.
+    Solo 'search_name' deve essere in inglese per il database immagini.
+    
+    SCHEMA JSON:
+    {{
+        "sessions": [
+            {{
+                "name": "Nome Sessione",
+                "exercises": [
+                    {{
+                        "name": "Nome Esercizio (Originale)",
+                        "search_name": "Nome in Inglese (Solo per ricerca)",
+                        "details": "Dettagli (COPIA ESATTA DALL'INPUT)",
+                        "note": "Note (COPIA ESATTA DALL'INPUT)"
+                    }}
+                ]
+            }}
+        ],
+        "note_coach": "{note_workout}"
+    }}
+    """
 
-    return ([], f"Nessun risultato per '{q}'")
+def diet_prompt(raw_diet, raw_supp, note_diet):
+    return f"""
+    Agisci come un nutrizionista sportivo ITALIANO.
+    
+    INPUT DIETA: {raw_diet if raw_diet else 'Nessuna'}. 
+    INPUT INTEGRAZIONE: {raw_supp if raw_supp else 'Nessuna'}.
+    NOTE DEL COACH: {note_diet}.
+    
+    ISTRUZIONI CRITICHE:
+    1. LINGUA: Usa SOLO ITALIANO.
+    2. CALORIE: Copia TUTTA la stringa dei target calorici (es. "2300 Training / 1900 Rest"). NON tagliarla.
+    3. GIORNI MULTIPLI: Se l'input contiene più tipologie di giorni, CREA un elemento nell'array 'days' PER OGNUNO DI ESSI. 
+    4. NOMI GIORNI: Usa ESATTAMENTE i nomi scritti dall'utente.
+    
+    SCHEMA JSON OBBLIGATORIO:
+    {{
+        "daily_calories": "Copia esatta della stringa target", 
+        "water_intake": "es. 3-4 Litri", 
+        "diet_note": "{note_diet}",
+        "days": [ 
+            {{ 
+                "day_name": "Nome Giorno 1", 
+                "meals": [ {{ "name": "Colazione", "foods": ["..."], "notes": "..." }} ] 
+            }}
+        ],
+        "supplements": [ 
+            {{ "name": "Creatina", "dose": "5g", "timing": "Post Workout", "notes": "..." }} 
+        ]
+    }}
+    """
+
+def translate_exercise_names(client_ai, names, force=False):
+    """Nomi esercizi -> nomi inglesi per la ricerca foto, tutti in UNA richiesta (stesso ordine)"""
+    prompt = f"""
+    Traduci in inglese questi nomi di esercizi da palestra, usando il nome più comune
+    nei database di esercizi (es. "Panca piana con manubri" -> "Dumbbell Bench Press").
+    Rispondi SOLO con JSON: {{"names": ["...", "..."]}} con {len(names)} elementi, nello stesso ordine.
+
+    NOMI:
+    {json.dumps(names, ensure_ascii=False)}
+    """
+    content = cached_completion(client_ai, model="gpt-4o", messages=[{"role":"system","content":prompt}], force=force)
+    translated = json.loads(clean_json_response(content)).get("names", [])
+    if len(translated) != len(names): raise ValueError("Traduzione incompleta")
+    return translated
+
+def generate_workout_plan(client_ai, raw_workout, note_workout, matcher, force=False):
+    """
+    Scheda: testo del coach -> JSON con le foto già abbinate (eseguibile fuori dal thread Streamlit).
+    Formato standard: lettura locale + sola traduzione dei nomi sconosciuti; altrimenti prompt completo.
+    """
+    plan_json, unknown = parse_workout(raw_workout)
+    if plan_json and not unknown:
+        plan_json['note_coach'] = note_workout
+        fill_search_names(plan_json, matcher.vocabulary, lambda names: translate_exercise_names(client_ai, names, force))
+    else:
+        content = cached_completion(client_ai, model="gpt-4o", messages=[{"role":"system","content":workout_prompt(raw_workout, note_workout)}], force=force)
+        plan_json = json.loads(clean_json_response(content))
+    # Foto abbinate sempre sul catalogo attuale (anche da cache), poi forma canonica validata da salvare
+    return normalize_plan(resolve_plan_images(plan_json, matcher))
+
+def generate_diet_plan(client_ai, raw_diet, raw_supp, note_diet, force=False):
+    """Dieta + integrazione: testo del coach -> JSON (eseguibile fuori dal thread Streamlit)"""
+    content = cached_completion(client_ai, model="gpt-4o", messages=[{"role":"system","content":diet_prompt(raw_diet, raw_supp, note_diet)}], force=force)
+    return normalize_diet(json.loads(clean_json_response(content)))
 
 # ==============================================================================
 # 3. INTERFACCIA COMUNE (RENDER & DOWNLOAD)
 # ==============================================================================
 
-def create_download_link_html(content_html, filename, label):
-    b64 = base64.b64encode(content_html.encode()).decode()
-    return f'<a href="data:text/html;base64,{b64}" download="{filename}" style="background-color:#E20613; color:white; padding:10px 20px; text-decoration:none; border-radius:5px; font-weight:bold; display:block; text-align:center; margin-top:10px; width:100%;">📄 {label}</a>'
+def html_download_button(export, filename, label):
+    """File HTML servito da Streamlit su richiesta (niente data-URI in pagina); chiave = hash del contenuto"""
+    digest, html_bytes = export
+    st.download_button(f"📄 {label}", html_bytes, filename, "text/html", key=f"dl::{filename}::{digest}", use_container_width=True)
 
 def render_preview_card(plan_json, show_debug=False):
     if not plan_json: return
-    if isinstance(plan_json, str):
-        try: plan_json = json.loads(plan_json)
-        except: return
-
-    sessions = plan_json.get('sessions', plan_json.get('Sessions', []))
-    if not sessions: return
-
-    html_content = """<html><head><style>body{font-family:Arial;padding:20px;} h1{color:#E20613;} .session{margin-top:20px;border-bottom:2px solid #333;} .ex{margin-bottom:10px;}</style></head><body><h1>SCHEDA ALLENAMENTO - AREA 199</h1>"""
-    for s in sessions:
-        html_content += f"<div class='session'><h2>{s.get('name','Sessione')}</h2>"
-        for ex in s.get('exercises', []):
-            html_content += f"<div class='ex'><strong>{ex.get('name','Ex')}</strong><br>{ex.get('details','')}<br><em>{ex.get('note','')}</em></div>"
-        html_content += "</div>"
-    if plan_json.get('note_coach'):
-        html_content += f"<div style='margin-top:20px; border:1px solid #E20613; padding:10px;'><strong>NOTE COACH:</strong><br>{plan_json.get('note_coach')}</div>"
-    html_content += "</body></html>"
-    
-    st.markdown(create_download_link_html(html_content, "Scheda_Allenamento.html", "SCARICA SCHEDA ALLENAMENTO"), unsafe_allow_html=True)
+    try: plan = parse_plan(plan_json)
+    except ValueError: return
+    if not plan.sessions: return
+
+    html_download_button(workout_export(plan.to_dict()), "Scheda_Allenamento.html", "SCARICA SCHEDA ALLENAMENTO")
 
-    for session in sessions:
-        s_name = session.get('name', session.get('Name', 'Sessione'))
-        st.markdown(f"<div class='session-header'>{s_name}</div>", unsafe_allow_html=True)
-        for ex in session.get('exercises', []):
+    # Foto della scheda scaricate in parallelo (e solo la prima volta), poi servite dal disco
+    prefetch([img for session in plan.sessions for ex in session.exercises for img in ex.images[:2]])
+
+    for session in plan.sessions:
+        st.markdown(f"<div class='session-header'>{session.name}</div>", unsafe_allow_html=True)
+        for ex in session.exercises:
             with st.container():
                 if show_debug:
-                    debug_msg = ex.get('debug_info', 'N/A')
-                    color = "#ff4b4b" if "Nessun risultato" in debug_msg else "#4ade80"
-                    st.markdown(f"<div class='debug-img' style='color:{color}'>🔍 {debug_msg}</div>", unsafe_allow_html=True)
+                    color = "#ff4b4b" if "Nessun risultato" in ex.debug_info else "#4ade80"
+                    st.markdown(f"<div class='debug-img' style='color:{color}'>🔍 {ex.debug_info}</div>", unsafe_allow_html=True)
                 c1, c2 = st.columns([2, 3])
                 with c1:
-                    if ex.get('images'):
+                    if ex.images:
                         cols_img = st.columns(2)
-                        if len(ex['images']) > 0: cols_img[0].image(ex['images'][0], use_container_width=True)
-                        if len(ex['images']) > 1: cols_img[1].image(ex['images'][1], use_container_width=True)
+                        for col, img in zip(cols_img, ex.images[:2]): col.image(image_source(img), use_container_width=True)
                     else: st.markdown("<div style='color:#444; font-size:0.8em; padding:20px; border:1px dashed #333; text-align:center;'>NO IMAGE</div>", unsafe_allow_html=True)
                 with c2:
-                    st.markdown(f"<div class='exercise-name'>{ex.get('name','')}</div>", unsafe_allow_html=True)
-                    st.markdown(f"<div class='exercise-details'>{ex.get('details','')}</div>", unsafe_allow_html=True)
-                    if ex.get('note'): st.markdown(f"<div class='exercise-note'>{ex.get('note')}</div>", unsafe_allow_html=True)
+                    st.markdown(f"<div class='exercise-name'>{ex.name}</div>", unsafe_allow_html=True)
+                    st.markdown(f"<div class='exercise-details'>{ex.details}</div>", unsafe_allow_html=True)
+                    if ex.note: st.markdown(f"<div class='exercise-note'>{ex.note}</div>", unsafe_allow_html=True)
             st.divider()
     
-    if plan_json.get('note_coach'):
-        st.info(f"📝 NOTE SCHEDA: {plan_json.get('note_coach')}")
+    if plan.note_coach:
+        st.info(f"📝 NOTE SCHEDA: {plan.note_coach}")
 
 def render_diet_card(diet_json):
     if not diet_json: return
-    if isinstance(diet_json, str):
-        try: diet_json = json.loads(diet_json)
-        except: return
+    try: diet = parse_diet(diet_json)
+    except ValueError: return
 
-    html_content = f"""<html><head><style>body{{font-family:Arial;padding:20px;}} h1{{color:#4ade80;}} h2{{color:#60a5fa;}} .meal{{margin-bottom:10px;padding-left:10px;border-left:3px solid #4ade80;}}</style></head><body><h1>PIANO ALIMENTARE</h1><p>Target: {diet_json.get('daily_calories','')} | Acqua: {diet_json.get('water_intake','')}</p>"""
-    
-    for day in diet_json.get('days', []):
-        html_content += f"<h3>{day.get('day_name')}</h3>"
-        for m in day.get('meals', []):
-            html_content += f"<div class='meal'><strong>{m.get('name')}</strong><br>{', '.join(m.get('foods',[]))}<br><em>{m.get('notes','')}</em></div>"
-    if diet_json.get('diet_note'): html_content += f"<br><strong>NOTE DIETA:</strong> {diet_json.get('diet_note')}"
-    
-    supps = diet_json.get('supplements', [])
-    if supps:
-        html_content += "<h2>INTEGRAZIONE</h2><ul>"
-        for s in supps:
-            html_content += f"<li><strong>{s.get('name')}</strong>: {s.get('dose')} ({s.get('timing')}) - <em>{s.get('notes','')}</em></li>"
-        html_content += "</ul>"
-    
-    html_content += "</body></html>"
-    st.markdown(create_download_link_html(html_content, "Piano_Nutrizionale.html", "SCARICA PIANO NUTRIZIONALE"), unsafe_allow_html=True)
-
-    if 'daily_calories' in diet_json:
-        st.info(f"🔥 Target: {diet_json.get('daily_calories')} | 💧 {diet_json.get('water_intake', '2-3L')}")
-
-    days = diet_json.get('days', [])
-    for day in days:
-        with st.expander(f"📅 {day.get('day_name', 'Giornata Tipo')}", expanded=False):
-            for meal in day.get('meals', []):
-                st.markdown(f"<div class='meal-header'>{meal.get('name', 'Pasto')}</div>", unsafe_allow_html=True)
-                foods = meal.get('foods', [])
-                if isinstance(foods, list):
-                    for food in foods: st.markdown(f"<div class='food-item'>• {food}</div>", unsafe_allow_html=True)
-                else: st.write(foods)
-                if meal.get('notes'): st.caption(f"📝 {meal['notes']}")
-
-    if diet_json.get('diet_note'):
-        st.markdown(f"<div class='note-box'><strong style='color:#4ade80;'>💬 NOTE DIETA:</strong><br><span style='color:#ddd;'>{diet_json['diet_note']}</span></div>", unsafe_allow_html=True)
-
-    supps = diet_json.get('supplements', [])
-    if supps:
+    html_download_button(diet_export(diet.to_dict()), "Piano_Nutrizionale.html", "SCARICA PIANO NUTRIZIONALE")
+
+    if diet.daily_calories is not None:
+        st.info(f"🔥 Target: {diet.daily_calories} | 💧 {diet.water_intake or '2-3L'}")
+
+    for day in diet.days:
+        with st.expander(f"📅 {day.name}", expanded=False):
+            for meal in day.meals:
+                st.markdown(f"<div class='meal-header'>{meal.name}</div>", unsafe_allow_html=True)
+                for food in meal.foods: st.markdown(f"<div class='food-item'>• {food}</div>", unsafe_allow_html=True)
+                if meal.notes: st.caption(f"📝 {meal.notes}")
+
+    if diet.diet_note:
+        st.markdown(f"<div class='note-box'><strong style='color:#4ade80;'>💬 NOTE DIETA:</strong><br><span style='color:#ddd;'>{diet.diet_note}</span></div>", unsafe_allow_html=True)
+
+    if diet.supplements:
         st.markdown("---")
         st.markdown("### 💊 INTEGRAZIONE")
-        for s in supps:
+        for s in diet.supplements:
             st.markdown(f"""
             <div class="supp-item">
-                <strong style="color:#60a5fa; font-size:1.1em;">{s.get('name')}</strong><br>
-                <span style="color:white;">⚖️ {s.get('dose')}</span> | 
-                <span style="color:#aaa;">🕒 {s.get('timing')}</span>
-                <div style="color:#666; font-style:italic; font-size:0.9em;">{s.get('notes','')}</div>
+                <strong style="color:#60a5fa; font-size:1.1em;">{s.name}</strong><br>
+                <span style="color:white;">⚖️ {s.dose}</span> | 
+                <span style="color:#aaa;">🕒 {s.timing}</span>
+                <div style="color:#666; font-style:italic; font-size:0.9em;">{s.notes}</div>
             </div>
             """, unsafe_allow_html=True)
 
@@ -282,7 +313,6 @@ def render_diet_card(diet_json):
 # ==============================================================================
 
 def run_coach_dashboard():
-    client = get_client()
     ex_db = load_exercise_db()
     
     st.title("DASHBOARD COACH")
@@ -294,49 +324,76 @@ def run_coach_dashboard():
             st.write(f"📊 **Database:** {db_len} esercizi.")
             if db_len < 800: st.error("⚠️ DATABASE INCOMPLETO! Premi il tasto rosso.")
             else: st.success("✅ Database OK")
+            st.caption(get_exercise_catalog().status())
         with c2:
             if st.button("🧨 FORZA RESET DB", type="primary"):
-                st.cache_data.clear(); st.rerun()
+                with st.spinner("Scarico il catalogo..."):
+                    get_exercise_catalog().refresh(force=True)
+                st.rerun()
 
         st.info("Scrivi qui sotto il nome dell'esercizio per vedere le FOTO e il NOME ESATTO da copiare nella scheda.")
         search_term = st.text_input("Cerca esercizio (es. 'plank', 'chest')")
         
-        if search_term and len(search_term) > 2:
-            results = [x for x in ex_db if search_term.lower() in x['name'].lower()]
+        index = get_exercise_search_index(get_exercise_catalog().version)
+        f1, f2, f3 = st.columns(3)
+        f_cat = f1.selectbox("Categoria", ["Tutte"] + index.categories)
+        f_equip = f2.selectbox("Attrezzo", ["Tutti"] + index.equipment)
+        f_muscle = f3.selectbox("Muscolo", ["Tutti"] + index.muscles)
+        filters = {
+            'category': None if f_cat == "Tutte" else f_cat,
+            'equipment': None if f_equip == "Tutti" else f_equip,
+            'muscle': None if f_muscle == "Tutti" else f_muscle,
+        }
+        
+        if (search_term and len(search_term) > 2) or any(filters.values()):
+            results = index.search(search_term, **filters)
             if results:
+                n_pages = (len(results) - 1) // BROWSER_PAGE_SIZE + 1
+                page = 1
+                if n_pages > 1:
+                    # Chiave legata alla ricerca: ogni nuova ricerca riparte da pagina 1
+                    page = st.number_input(f"Pagina (di {n_pages})", 1, n_pages, 1, key=f"ex_page::{search_term}::{filters}")
                 st.write(f"Trovati {len(results)} esercizi:")
                 cols_db = st.columns(4) # Griglia da 4 colonne
                 
-                for idx, res in enumerate(results[:20]):
+                page_items = index.page(results, page, BROWSER_PAGE_SIZE)
+                prefetch([p if p.startswith("http") else BASE_URL + p for r in page_items for p in r.get('images', [])[:2]], "thumb")
+                
+                for idx, res in enumerate(page_items):
                     with cols_db[idx % 4]:
                         st.markdown(f"**{res['name']}**")
                         
                         # --- MODIFICA: MOSTRA TUTTE LE IMMAGINI (Max 2) ---
                         if res.get('images'):
-                            # Base URL per GitHub
-                            BASE_URL = "https://raw.githubusercontent.com/yuhonas/free-exercise-db/main/exercises/"
-                            
                             for img_path in res['images'][:2]: # Prende al massimo le prime 2
-                                # Controllo intelligente: è un link completo o serve il pezzo prima?
+                                # Controllo intelligente: è un link completo o serve il pezzo prima (BASE_URL GitHub)?
                                 if img_path.startswith("http"):
                                     full_url = img_path
                                 else:
                                     full_url = BASE_URL + img_path
                                 
-                                st.image(full_url, use_container_width=True)
+                                st.image(image_source(full_url, "thumb"), use_container_width=True)
                                 
                         st.code(res['name'], language=None)
             else: st.warning("Nessun esercizio trovato.")
     
     st.divider()
 
-    try:
-        sh_ana = client.open("BIO ENTRY ANAMNESI").sheet1
-        raw_emails = [str(r.get('E-mail') or r.get('Email')).strip().lower() for r in sh_ana.get_all_records()]
-        emails = sorted(list(set([e for e in raw_emails if e and e != 'none'])))
-    except: st.error("⚠️ Errore critico: Impossibile leggere BIO ENTRY ANAMNESI"); return
-
-    sel_email = st.selectbox("SELEZIONA ATLETA", [""] + emails)
+    roster = get_roster()
+    c_search, c_refresh = st.columns([4, 1])
+    with c_refresh:
+        force_roster = st.button("🔄 AGGIORNA ATLETI")
+        if st.button("💳 AGGIORNA ABBONAMENTI"):
+            get_subscriptions().invalidate()
+            st.toast("Abbonamenti riletti al prossimo accesso degli atleti")
+    try: roster.refresh(get_table("BIO ENTRY ANAMNESI"), force=force_roster)
+    except: 
+        if not roster.entries: st.error("⚠️ Errore critico: Impossibile leggere BIO ENTRY ANAMNESI"); return
+
+    with c_search:
+        athlete_query = st.text_input("Cerca atleta (email o nome)", key="athlete_query")
+    emails = roster.search(athlete_query)
+    sel_email = st.selectbox("SELEZIONA ATLETA", [""] + emails, format_func=lambda e: roster.label(e) if e else "")
 
     if sel_email:
         if 'current_athlete' not in st.session_state or st.session_state['current_athlete'] != sel_email:
@@ -350,14 +407,11 @@ def run_coach_dashboard():
         
         if not history: st.warning("Nessun dato storico trovato.")
         else:
-            last = history[-1]
+            analysis = analyze_history(history)
             st.success(f"📈 CONTROLLO ({len(history)} ingressi)")
-            metrics_keys = [k for k, v in last.items() if isinstance(v, (int, float)) and v > 0]
             row_cols = st.columns(3)
-            for i, key in enumerate(metrics_keys):
-                vals = [h.get(key, 0) for h in history]
-                curr = vals[-1]; prev = vals[-2] if len(vals)>1 else vals[0]; start = vals[0]
-                d_prev = curr - prev; d_start = curr - start
+            for i, (key, m) in enumerate(analysis['deltas'].iterrows()):
+                curr, d_prev, d_start = m['current'], m['delta_prev'], m['delta_start']
                 with row_cols[i % 3]:
                     st.markdown(f"""
                     <div class="metric-box">
@@ -369,6 +423,18 @@ def run_coach_dashboard():
                         </div>
                     </div>""", unsafe_allow_html=True)
 
+            trends = analysis['trends'].dropna(axis=1, how='all')
+            if len(trends) > 1:
+                with st.expander("📉 TREND E ASIMMETRIE", expanded=False):
+                    chosen = st.multiselect("Misure", list(trends.columns), default=[c for c in ["Peso", "Addome"] if c in trends.columns], key="trend_metrics")
+                    if chosen:
+                        st.line_chart(trends[chosen])
+                        st.caption("Variazione media per settimana (ultime 8 settimane)")
+                        st.dataframe(analysis['rates'][chosen].tail(1).round(2), hide_index=True, use_container_width=True)
+                    asym = analysis['asymmetry'].dropna(axis=1, how='all')
+                    if not asym.empty:
+                        st.caption("Asimmetria Dx vs Sx (%)")
+                        st.line_chart(asym)
         st.divider()
 
         st.subheader("🛠️ CREAZIONE PIANO")
@@ -395,96 +461,27 @@ def run_coach_dashboard():
         st.markdown("---")
         comment_input = st.text_area("💬 MESSAGGIO CHAT GENERALE (Visibile in alto a tutto)", height=100, key="input_comment")
 
+        force_ai = st.checkbox("🔁 Forza rigenerazione (ignora risposte AI in cache)", key="force_ai_preview")
         if st.button("🔄 GENERA ANTEPRIMA"):
             with st.spinner("Elaborazione..."):
-                client_ai = openai.Client(api_key=st.secrets["openai_key"])
-                
-                # 1. WORKOUT
-                if raw_workout:
-                    prompt_w = f"""
-                    Agisci come un parser JSON "FOTOCOPIATRICE".
-                    
-                    INPUT UTENTE:
-                    {raw_workout}
-                    
-                    NOTE COACH:
-                    {note_workout}
-                    
-                    REGOLA SUPREMA: NON TRADURRE NULLA.
-                    Se l'input è in Italiano, l'output DEVE ESSERE IN ITALIANO.
-                    Copia 'details' e 'note' ESATTAMENTE come scritti dall'utente, parola per parola.
-                    Solo 'search_name' deve essere in inglese per il database immagini.
-                    
-                    SCHEMA JSON:
-                    {{
-                        "sessions": [
-                            {{
-                                "name": "Nome Sessione",
-                                "exercises": [
-                                    {{
-                                        "name": "Nome Esercizio (Originale)",
-                                        "search_name": "Nome in Inglese (Solo per ricerca)",
-                                        "details": "Dettagli (COPIA ESATTA DALL'INPUT)",
-                                        "note": "Note (COPIA ESATTA DALL'INPUT)"
-                                    }}
-                                ]
-                            }}
-                        ],
-                        "note_coach": "{note_workout}"
-                    }}
-                    """
-                    try:
-                        res_w = client_ai.chat.completions.create(model="gpt-4o", messages=[{"role":"system","content":prompt_w}])
-                        clean_w = clean_json_response(res_w.choices[0].message.content)
-                        plan_json = json.loads(clean_w)
-                        for s in plan_json.get('sessions', []):
-                            for ex in s.get('exercises', []):
-                                query = ex.get('search_name', ex.get('name'))
-                                imgs, debug_msg = find_exercise_images(query, ex_db)
-                                ex['images'] = imgs[:2]
-                                ex['debug_info'] = f"Query: '{query}' -> {debug_msg}"
-                        st.session_state['generated_plan'] = plan_json
-                    except: st.error("Errore AI Workout")
-                else: st.session_state['generated_plan'] = None
+                client_ai = openai.Client(api_key=st.secrets["openai_key"], timeout=LLM_TIMEOUT, max_retries=LLM_RETRIES)
+                matcher = get_exercise_matcher(get_exercise_catalog().version) # Cache Streamlit: nel thread principale
 
-                # 2. DIETA
-                if raw_diet or raw_supp:
-                    prompt_d = f"""
-                    Agisci come un nutrizionista sportivo ITALIANO.
-                    
-                    INPUT DIETA: {raw_diet if raw_diet else 'Nessuna'}. 
-                    INPUT INTEGRAZIONE: {raw_supp if raw_supp else 'Nessuna'}.
-                    NOTE DEL COACH: {note_diet}.
-                    
-                    ISTRUZIONI CRITICHE:
-                    1. LINGUA: Usa SOLO ITALIANO.
-                    2. CALORIE: Copia TUTTA la stringa dei target calorici (es. "2300 Training / 1900 Rest"). NON tagliarla.
-                    3. GIORNI MULTIPLI: Se l'input contiene più tipologie di giorni, CREA un elemento nell'array 'days' PER OGNUNO DI ESSI. 
-                    4. NOMI GIORNI: Usa ESATTAMENTE i nomi scritti dall'utente.
-                    
-                    SCHEMA JSON OBBLIGATORIO:
-                    {{
-                        "daily_calories": "Copia esatta della stringa target", 
-                        "water_intake": "es. 3-4 Litri", 
-                        "diet_note": "{note_diet}",
-                        "days": [ 
-                            {{ 
-                                "day_name": "Nome Giorno 1", 
-                                "meals": [ {{ "name": "Colazione", "foods": ["..."], "notes": "..." }} ] 
-                            }}
-                        ],
-                        "supplements": [ 
-                            {{ "name": "Creatina", "dose": "5g", "timing": "Post Workout", "notes": "..." }} 
-                        ]
-                    }}
-                    """
-                    try:
-                        res_d = client_ai.chat.completions.create(model="gpt-4o", messages=[{"role":"system","content":prompt_d}])
-                        diet_json = json.loads(clean_json_response(res_d.choices[0].message.content))
-                        st.session_state['generated_diet'] = diet_json
-                    except: st.error("Errore AI Dieta/Supp")
+                # Le due richieste partono insieme: attesa = la più lenta, non la somma.
+                # Le foto si abbinano dentro il task scheda, mentre la dieta è ancora in corso.
+                jobs = {}
+                if raw_workout: jobs['generated_plan'] = LLM_POOL.submit(generate_workout_plan, client_ai, raw_workout, note_workout, matcher, force_ai)
+                else: st.session_state['generated_plan'] = None
+                if raw_diet or raw_supp: jobs['generated_diet'] = LLM_POOL.submit(generate_diet_plan, client_ai, raw_diet, raw_supp, note_diet, force_ai)
                 else: st.session_state['generated_diet'] = None
 
+                labels = {'generated_plan': "Errore AI Workout", 'generated_diet': "Errore AI Dieta/Supp"}
+                # Il limite di tempo è sulla singola chiamata a OpenAI, non sull'attesa in coda nel pool
+                for key, job in jobs.items():
+                    try: st.session_state[key] = job.result()
+                    except openai.APITimeoutError: st.error(f"{labels[key]}: nessuna risposta entro {LLM_TIMEOUT}s")
+                    except Exception as e: st.error(f"{labels[key]}: {e}")
+
         if st.session_state.get('generated_plan') or st.session_state.get('generated_diet'):
             st.markdown("---")
             st.subheader("👁️ ANTEPRIMA FINALE")
@@ -500,21 +497,12 @@ def run_coach_dashboard():
 
             if st.button("✅ INVIA TUTTO AL CLIENTE", type="primary"):
                 try:
-                    db = client.open("AREA199_DB").worksheet("SCHEDE_ATTIVE")
                     full_name = f"{sel_email}" 
                     
-                    json_w = json.dumps(st.session_state['generated_plan']) if st.session_state['generated_plan'] else ""
-                    json_d = json.dumps(st.session_state['generated_diet']) if st.session_state['generated_diet'] else ""
-                    
-                    db.append_row([
-                        datetime.now().strftime("%Y-%m-%d"),
-                        sel_email,
-                        full_name,
-                        st.session_state['coach_comment'],
-                        json_w, 
-                        json_d  
-                    ])
-                    st.success("INVIATA CORRETTAMENTE!")
+                    # Salvataggio in coda locale (JSON compressi): nessuna attesa su Google, invio a blocchi in background
+                    save_plan(sel_email, full_name, st.session_state['coach_comment'],
+                              st.session_state['generated_plan'], st.session_state['generated_diet'])
+                    st.success("INVIATA CORRETTAMENTE! (sincronizzazione con il database in corso)")
                     st.session_state['generated_plan'] = None
                     st.session_state['generated_diet'] = None
                 except Exception as e: st.error(f"Errore DB: {e}")
@@ -528,30 +516,33 @@ def check_subscription_status(email):
     Ritorna: is_blocked, status_color, msg, custom_link, scadenza_str
     """
     try:
-        client = get_client()
+        subs = get_subscriptions()
+        def open_table(): return get_table("AREA199_DB", "CLIENTI_ATTIVI")
         try:
-            sh = client.open("AREA199_DB").worksheet("CLIENTI_ATTIVI")
+            subs.refresh(open_table)
         except:
-            return False, 'green', "Foglio Controllo Assente", "", "N/A"
-
-        records = sh.get_all_records()
-        clean_email = email.strip().lower()
-        
-        user_record = None
-        for r in records:
-            if str(r.get('Email')).strip().lower() == clean_email:
-                user_record = r
-                break
+            # Foglio irraggiungibile: si continua con l'ultima mappa, se c'è
+            if not subs.loaded:
+                try: open_table()
+                except: return False, 'green', "Foglio Controllo Assente", "", "N/A"
+                raise
+
+        user_record = subs.get(email)
+        # Assente o scaduto con mappa non freschissima: rilettura immediata (rinnovo appena registrato)
+        if (not user_record or not user_record[1] or user_record[1] < datetime.now()) and subs.age() > subs.recheck_after:
+            try:
+                subs.refresh(open_table, force=True)
+                user_record = subs.get(email)
+            except: pass
         
         if not user_record:
             return True, 'red', "❌ UTENTE NON TROVATO. Contatta il coach.", "", ""
             
         # Dati Utente
-        scadenza_str = str(user_record.get('Scadenza'))
-        custom_link = str(user_record.get('Link_Pagamento', '')).strip()
+        scadenza_str, scadenza_dt, custom_link = user_record
         
         try:
-            scadenza_dt = datetime.strptime(scadenza_str, "%d/%m/%Y")
+            if scadenza_dt is None: raise ValueError(scadenza_str)
             oggi = datetime.now()
             
             # Calcoliamo la differenza di giorni
@@ -577,8 +568,6 @@ def check_subscription_status(email):
         return True, 'red', f"Errore verifica: {e}", "", ""
 
 def run_athlete_dashboard(email):
-    client = get_client()
-    
     # LINK DI RISERVA
     LINK_DEFAULT = "https://revolut.me/antope1909?currency=EUR&amount=40" 
     
@@ -630,12 +619,9 @@ def run_athlete_dashboard(email):
 
     # 2. CARICAMENTO SCHEDA
     try:
-        sh = client.open("AREA199_DB").worksheet("SCHEDE_ATTIVE")
-        data = sh.get_all_records()
-        my_plans = [x for x in data if str(x.get('Email','')).strip().lower() == email.strip().lower()]
+        last_plan = get_latest_plan(email)
         
-        if my_plans:
-            last_plan = my_plans[-1]
+        if last_plan:
             st.title(f"Piano del {last_plan['Data']}")
             if last_plan.get('Commento'): st.info(f"💬 **Messaggio dal Coach:**\n\n{last_plan['Commento']}")
             
@@ -646,19 +632,13 @@ def run_athlete_dashboard(email):
             
             with tab_w:
                 if raw_w:
-                    try:
-                        try: w_json = json.loads(raw_w)
-                        except: w_json = ast.literal_eval(raw_w)
-                        render_preview_card(w_json, show_debug=False)
+                    try: render_preview_card(parse_plan(raw_w), show_debug=False) # Analisi in cache per contenuto
                     except: st.error("Errore visualizzazione scheda.")
                 else: st.info("Nessun allenamento.")
 
             with tab_n:
                 if raw_d:
-                    try:
-                        try: d_json = json.loads(raw_d)
-                        except: d_json = ast.literal_eval(raw_d)
-                        render_diet_card(d_json)
+                    try: render_diet_card(parse_diet(raw_d))
                     except: st.error("Errore visualizzazione nutrizione.")
                 else: st.info("Nessuna alimentazione.")
 
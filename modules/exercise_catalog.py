@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import datetime
+import requests
+from modules.local_db import cache_path
+
+# ==============================================================================
+# CATALOGO ESERCIZI (free-exercise-db) CON COPIA SU DISCO
+# All'avvio si legge lo snapshot locale; l'aggiornamento avviene in background
+# con richiesta condizionale (ETag / If-Modified-Since): se GitHub è lento o
+# irraggiungibile si continua a lavorare con l'ultima copia valida.
+# ==============================================================================
+
+CATALOG_URL = "https://raw.githubusercontent.com/yuhonas/free-exercise-db/main/dist/exercises.json"
+SNAPSHOT_FILE = "exercises.json"
+META_FILE = "exercises.meta.json"
+REFRESH_EVERY = 6 * 3600  # Secondi tra due controlli di aggiornamento
+RETRY_EVERY = 300         # Dopo un errore di rete, nuovo tentativo non prima di 5 minuti
+TIMEOUT = 20
+
+def _read_json(path, default):
+    try:
+        with open(path, encoding="utf-8") as f: return json.load(f)
+    except Exception: return default
+
+def _write_json(path, data):
+    """Scrittura atomica: gli altri worker non leggono mai un file a metà"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f: json.dump(data, f)
+    os.replace(tmp, path)
+
+class ExerciseCatalog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.exercises = []
+        self.meta = {}
+        self.loaded_mtime = None
+        self.refreshing = False
+        self.last_error = ""
+        self.last_attempt = 0.0
+
+    @property
+    def version(self):
+        """Impronta del contenuto: cambia solo quando cambia il catalogo"""
+        return self.meta.get("version", "")
+
+    def _load_from_disk(self):
+        path = cache_path(SNAPSHOT_FILE)
+        try: mtime = os.path.getmtime(path)
+        except OSError: return False
+        if mtime == self.loaded_mtime: return True
+        data = _read_json(path, None)
+        if not isinstance(data, list): return False
+        self.exercises = sorted(data, key=lambda x: x['name'])
+        self.meta = _read_json(cache_path(META_FILE), {})
+        self.loaded_mtime = mtime
+        return True
+
+    def refresh(self, force=False):
+        """
+        Scarica il catalogo se è cambiato (force = ignora ETag e riscarica comunque).
+        Ritorna "updated", "not_modified" oppure "error".
+        """
+        self.last_attempt = time.time()
+        meta = _read_json(cache_path(META_FILE), {})
+        headers = {}
+        if not force and os.path.exists(cache_path(SNAPSHOT_FILE)):
+            if meta.get("etag"): headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"): headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            resp = requests.get(CATALOG_URL, headers=headers, timeout=TIMEOUT)
+            now = datetime.datetime.now().isoformat(timespec="seconds")
+            if resp.status_code == 304:
+                meta["checked_at"] = now
+                _write_json(cache_path(META_FILE), meta)
+                with self.lock: self.meta = meta
+                return "not_modified"
+            resp.raise_for_status()
+            data = resp.json()
+            if not isinstance(data, list) or not data: raise ValueError("Catalogo vuoto o non valido")
+
+            meta = {
+                "etag": resp.headers.get("ETag", ""),
+                "last_modified": resp.headers.get("Last-Modified", ""),
+                "version": hashlib.sha1(resp.content).hexdigest()[:12],
+                "fetched_at": now, "checked_at": now, "count": len(data),
+            }
+            _write_json(cache_path(SNAPSHOT_FILE), data)
+            _write_json(cache_path(META_FILE), meta)
+            with self.lock: self._load_from_disk()
+            self.last_error = ""
+            return "updated"
+        except Exception as e:
+            self.last_error = str(e)
+            return "error"
+
+    def _is_stale(self):
+        if self.last_error and time.time() - self.last_attempt < RETRY_EVERY: return False
+        checked = self.meta.get("checked_at")
+        if not checked: return True
+        try: age = time.time() - datetime.datetime.fromisoformat(checked).timestamp()
+        except ValueError: return True
+        return age > REFRESH_EVERY
+
+    def _refresh_in_background(self):
+        def run():
+            try: self.refresh()
+            finally: self.refreshing = False
+        self.refreshing = True
+        threading.Thread(target=run, name="area199-catalog", daemon=True).start()
+
+    def get(self):
+        """Esercizi dallo snapshot (ricaricato se un altro worker l'ha aggiornato); avvia il refresh se serve"""
+        with self.lock:
+            has_snapshot = self._load_from_disk()
+        if not has_snapshot and not self.last_attempt:
+            # Primo avvio senza copia locale: unico caso in cui si aspetta la rete
+            self.refresh(force=True)
+        elif self._is_stale() and not self.refreshing:
+            self._refresh_in_background()
+        return self.exercises
+
+    def status(self):
+        """Testo per la UI: versione, data e stato dell'ultima verifica"""
+        if not self.exercises: return f"Catalogo non disponibile (offline). {self.last_error}".strip()
+        msg = f"Versione {self.version} del {self.meta.get('fetched_at', 'N/D')[:10]}"
+        if self.last_error: msg += " · ⚠️ aggiornamento non riuscito, uso copia locale"
+        return msg
@@ -0,0 +1,141 @@
+import re
+import numpy as np
+from rapidfuzz import process, fuzz
+
+# ==============================================================================
+# MOTORE DI ABBINAMENTO ESERCIZIO -> FOTO
+# Stesse regole di sempre (sinonimi, "contiene", fuzzy con controllo parole chiave),
+# ma con indice a trigrammi costruito una volta per versione del catalogo e
+# fuzzy calcolato in un'unica matrice (cdist) per tutti gli esercizi della scheda.
+# ==============================================================================
+
+BASE_URL = "https://raw.githubusercontent.com/yuhonas/free-exercise-db/main/exercises/"
+
+SYNONYMS = {
+    "lying leg curl": "lying leg curls",
+    "leg curl": "lying leg curls",
+    "leg extension": "leg extensions",
+    "leg press": "leg press",
+    "calf raise": "calf raise",
+    "hip adduction": "adductor",
+    "adduction": "adductor",
+    "reverse pec deck": "reverse fly",
+    "t-bar": "t-bar",
+    "lat pulldown": "pulldown",
+    "straight arm": "straight-arm pulldown",
+    "cable row": "seated cable row",
+    "hyperextension": "hyperextension",
+    "pec deck": "butterfly",
+    "chest press": "chest press",
+    "face pull": "face pull",
+    "lateral raise": "lateral raise",
+    "pushdown": "pushdown",
+    "triceps pushdown": "pushdown",
+    "preacher curl": "preacher curl",
+    "overhead cable": "overhead triceps",
+    "side plank": ["side plank", "side bridge"],
+    "plank": "plank",
+    "dead bug": "dead bug",
+    "vacuum": "stomach vacuum"
+}
+
+# Parole che devono comparire (o mancare) in entrambi: evita "leg press" -> "leg curl"
+BAD_WORDS = ["press", "fly", "row", "curl", "squat", "deadlift"]
+FUZZY_MIN_SCORE = 65
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def is_safe_match(q, cand_name):
+    is_safe = True
+    for w in BAD_WORDS:
+        if (w in q and w not in cand_name) or (w not in q and w in cand_name):
+            is_safe = False
+            if "bench press" in cand_name and "chest press" in q: is_safe = True
+    return is_safe
+
+def search_terms(q):
+    """Termini da cercare per 'contiene': il sinonimo più lungo presente nella query, altrimenti la query"""
+    for key in sorted(SYNONYMS.keys(), key=len, reverse=True):
+        if key in q:
+            val = SYNONYMS[key]
+            return val if isinstance(val, list) else [val]
+    return [q]
+
+class ExerciseMatcher:
+    def __init__(self, exercises):
+        self.exercises = exercises
+        self.names = [x['name'] for x in exercises]
+        self.lower = [n.lower() for n in self.names]
+        self.vocabulary = {w for name in self.lower for w in re.findall(r"[a-z0-9\-]+", name)} # Parole inglesi del catalogo
+        self.by_name = {}
+        for ex in exercises: self.by_name.setdefault(ex['name'], ex)
+
+        # Trigramma -> indici (ordine del catalogo) dei nomi che lo contengono
+        postings = {}
+        for i, name in enumerate(self.lower):
+            for g in _trigrams(name): postings.setdefault(g, []).append(i)
+        self.postings = {g: np.array(ids, dtype=np.int32) for g, ids in postings.items()}
+
+    def _images(self, ex):
+        return [BASE_URL + i for i in ex.get('images', [])]
+
+    def containing(self, term):
+        """Indici (ordine catalogo) dei nomi che contengono 'term', come `term in name.lower()`"""
+        t = term.lower()
+        grams = _trigrams(t)
+        if not grams: return [i for i, name in enumerate(self.lower) if t in name]
+        lists = sorted((self.postings.get(g) for g in grams), key=lambda a: 0 if a is None else len(a))
+        if lists[0] is None: return []
+        cand = lists[0]
+        for other in lists[1:]:
+            cand = np.intersect1d(cand, other, assume_unique=True)
+            if not len(cand): return []
+        return [int(i) for i in cand if t in self.lower[i]]
+
+    def _by_synonym(self, q):
+        for term in search_terms(q):
+            hits = self.containing(term)
+            if hits:
+                best = min(hits, key=lambda i: len(self.names[i]))
+                ex = self.exercises[best]
+                return (self._images(ex), f"Synonym: '{term}' -> {ex['name']}")
+        return None
+
+    def _by_fuzzy(self, q, name, score):
+        if score > FUZZY_MIN_SCORE and is_safe_match(q, name.lower()):
+            return (self._images(self.by_name[name]), f"Fuzzy: {name} ({score}%)")
+        return ([], f"Nessun risultato per '{q}'")
+
+    def find(self, name_query):
+        """Un solo esercizio: (lista URL immagini, messaggio di debug)"""
+        return self.resolve_many([name_query])[0]
+
+    def resolve_many(self, queries):
+        """Tutti gli esercizi in un colpo: sinonimi via indice, poi UNA matrice fuzzy per i rimanenti"""
+        results = [None] * len(queries)
+        pending = []
+        for n, name_query in enumerate(queries):
+            if not self.exercises or not name_query:
+                results[n] = ([], "DB/Query Vuota")
+                continue
+            q = name_query.lower().strip()
+            results[n] = self._by_synonym(q)
+            if results[n] is None: pending.append((n, q))
+
+        if pending:
+            scores = process.cdist([q for _, q in pending], self.names, scorer=fuzz.token_set_ratio,
+                                   dtype=np.float64, workers=-1)
+            for (n, q), row in zip(pending, scores):
+                best = int(np.argmax(row)) # primo massimo, come extractOne
+                results[n] = self._by_fuzzy(q, self.names[best], float(row[best]))
+        return results
+
+def resolve_plan_images(plan_json, matcher):
+    """Abbina le foto a tutti gli esercizi della scheda con una sola chiamata batch"""
+    exercises = [ex for s in plan_json.get('sessions', []) for ex in s.get('exercises', [])]
+    queries = [ex.get('search_name', ex.get('name')) for ex in exercises]
+    for ex, query, (imgs, debug_msg) in zip(exercises, queries, matcher.resolve_many(queries)):
+        ex['images'] = imgs[:2]
+        ex['debug_info'] = f"Query: '{query}' -> {debug_msg}"
+    return plan_json
@@ -0,0 +1,89 @@
+import re
+import bisect
+
+# ==============================================================================
+# INDICE DI RICERCA DEL BROWSER ESERCIZI
+# Parole di nome, muscoli, attrezzo e categoria -> esercizi, con ricerca per
+# prefisso ("ben" trova "bench"), filtri e risultati ordinati per pertinenza.
+# Costruito una volta per versione del catalogo; la pagina materializza solo
+# gli esercizi visibili.
+# ==============================================================================
+
+# Peso di ogni campo nel punteggio (il nome conta più dei muscoli, ecc.)
+FIELD_WEIGHTS = {"name": 3, "primaryMuscles": 2, "secondaryMuscles": 1, "equipment": 1, "category": 1}
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", str(text).lower())
+
+def _as_list(value):
+    if not value: return []
+    return value if isinstance(value, list) else [value]
+
+class ExerciseSearchIndex:
+    def __init__(self, exercises):
+        self.exercises = exercises
+        self.names = [str(x.get('name', '')).lower() for x in exercises]
+
+        # parola -> {indice esercizio: peso del campo migliore}
+        postings = {}
+        for i, ex in enumerate(exercises):
+            for field, weight in FIELD_WEIGHTS.items():
+                for value in _as_list(ex.get(field)):
+                    for tok in tokenize(value):
+                        docs = postings.setdefault(tok, {})
+                        if docs.get(i, 0) < weight: docs[i] = weight
+        self.postings = postings
+        self.vocabulary = sorted(postings)
+
+        self.categories = sorted({str(x['category']) for x in exercises if x.get('category')})
+        self.equipment = sorted({str(x['equipment']) for x in exercises if x.get('equipment')})
+        self.muscles = sorted({m for x in exercises for m in _as_list(x.get('primaryMuscles'))})
+
+    def _prefix_matches(self, prefix):
+        """{esercizio: peso} per tutte le parole dell'indice che iniziano con 'prefix'"""
+        found = {}
+        pos = bisect.bisect_left(self.vocabulary, prefix)
+        while pos < len(self.vocabulary) and self.vocabulary[pos].startswith(prefix):
+            for i, w in self.postings[self.vocabulary[pos]].items():
+                if found.get(i, 0) < w: found[i] = w
+            pos += 1
+        return found
+
+    def _passes(self, ex, category, equipment, muscle):
+        if category and ex.get('category') != category: return False
+        if equipment and ex.get('equipment') != equipment: return False
+        if muscle and muscle not in _as_list(ex.get('primaryMuscles')) + _as_list(ex.get('secondaryMuscles')):
+            return False
+        return True
+
+    def search(self, query, category=None, equipment=None, muscle=None):
+        """Indici degli esercizi, dal più pertinente. Tutte le parole della ricerca devono trovare riscontro."""
+        q = str(query or "").lower().strip()
+        tokens = tokenize(q)
+
+        if tokens:
+            scores = None
+            for tok in tokens:
+                hits = self._prefix_matches(tok)
+                if scores is None: scores = dict(hits)
+                else: scores = {i: s + hits[i] for i, s in scores.items() if i in hits}
+                if not scores: break
+            # Nessun prefisso: vecchia ricerca "contiene" sul nome (es. "ench")
+            if not scores: scores = {i: 1 for i, name in enumerate(self.names) if q in name}
+        else:
+            scores = {i: 0 for i in range(len(self.exercises))}
+
+        ranked = []
+        for i, score in scores.items():
+            if not self._passes(self.exercises[i], category, equipment, muscle): continue
+            name = self.names[i]
+            if q and name.startswith(q): score += 5
+            elif q and q in name: score += 3
+            ranked.append((-score, len(name) if q else 0, name, i)) # Senza testo: ordine alfabetico
+        ranked.sort()
+        return [i for *_, i in ranked]
+
+    def page(self, ids, page, page_size):
+        """Solo gli esercizi della pagina richiesta (1 = prima)"""
+        start = (page - 1) * page_size
+        return [self.exercises[i] for i in ids[start:start + page_size]]
@@ -0,0 +1,96 @@
+import io
+import os
+import time
+import hashlib
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from PIL import Image
+from modules.local_db import cache_path
+
+# ==============================================================================
+# CACHE LOCALE DELLE FOTO ESERCIZI
+# Ogni foto viene scaricata da GitHub UNA volta, ridotta in WebP (2 misure)
+# e servita come bytes a st.image. Oltre MAX_BYTES si eliminano le meno usate.
+# ==============================================================================
+
+SIZES = {"thumb": 240, "card": 480}  # Lato massimo in pixel
+QUALITY = 80
+MAX_BYTES = 200 * 1024 * 1024         # Tetto della cartella immagini (200 MB)
+EVICT_EVERY = 50                      # Controllo spazio ogni N nuove immagini
+TIMEOUT = 10
+RETRY_AFTER = 600                     # Foto non scaricabile: nuovo tentativo dopo 10 minuti
+
+_failed = {}                          # url -> momento dell'ultimo errore
+_locks = {}
+_locks_guard = threading.Lock()
+_writes = itertools.count(1)          # Foto salvate: next() è atomico tra i thread del pool
+_pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix="area199-img")
+
+def _path(url, size):
+    return cache_path("images", size, hashlib.sha1(url.encode()).hexdigest() + ".webp")
+
+def _url_lock(url):
+    with _locks_guard:
+        return _locks.setdefault(url, threading.Lock())
+
+def _evict():
+    """Elimina i file usati meno di recente finché la cartella torna sotto MAX_BYTES"""
+    files = []
+    for size in SIZES:
+        folder = cache_path("images", size)
+        for name in os.listdir(folder):
+            try:
+                info = os.stat(os.path.join(folder, name))
+                files.append((info.st_mtime, info.st_size, os.path.join(folder, name)))
+            except OSError: pass
+    total = sum(f[1] for f in files)
+    for _, size, path in sorted(files):
+        if total <= MAX_BYTES: break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError: pass
+
+def _download(url):
+    """Scarica l'originale e salva tutte le misure (un solo download per foto)"""
+    resp = requests.get(url, timeout=TIMEOUT)
+    resp.raise_for_status()
+    img = Image.open(io.BytesIO(resp.content)).convert("RGB")
+    for size, side in SIZES.items():
+        thumb = img.copy()
+        thumb.thumbnail((side, side))
+        path = _path(url, size)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        thumb.save(tmp, "WEBP", quality=QUALITY)
+        os.replace(tmp, path)
+    if next(_writes) % EVICT_EVERY == 0: _evict()
+
+def get_image(url, size="card"):
+    """Bytes WebP della foto (scaricata se manca), None se non disponibile"""
+    path = _path(url, size)
+    if not os.path.exists(path):
+        if time.time() - _failed.get(url, 0) < RETRY_AFTER: return None
+        with _url_lock(url):
+            if not os.path.exists(path):
+                try: _download(url)
+                except Exception:
+                    _failed[url] = time.time()
+                    return None
+    try:
+        os.utime(path) # Segna come usata (LRU)
+        with open(path, "rb") as f: return f.read()
+    except OSError:
+        return None
+
+def image_source(url, size="card"):
+    """Per st.image: bytes dalla cache locale, oppure l'URL originale se la cache non riesce"""
+    if not url or not str(url).startswith("http"): return url
+    return get_image(url, size) or url
+
+def prefetch(urls, size="card"):
+    """Scarica in parallelo le foto che mancano (es. tutta la pagina prima di disegnarla)"""
+    missing = [u for u in set(urls) if u and str(u).startswith("http") and not os.path.exists(_path(u, size))]
+    list(_pool.map(lambda u: get_image(u, size), missing))
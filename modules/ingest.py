@@ -0,0 +1,56 @@
+import re
+import pandas as pd
+
+# ==============================================================================
+# INGESTIONE COLONNARE DEI FOGLI
+# Pulizia dei numeri scritti a mano nei fogli (virgole, %, kg/cm) applicata
+# a colonne intere (una passata vettoriale invece di una regex per cella).
+# ==============================================================================
+
+NUMBER_PATTERN = r"([-+]?\d*\.\d+|\d+)"
+
+def normalize_key(key):
+    return re.sub(r'[^a-zA-Z0-9]', '', str(key).lower())
+
+def _as_text(col):
+    return pd.Series(col, dtype=object).fillna("").astype(str)
+
+def to_float_column(col):
+    """Virgola -> punto, via tutto ciò che non è numero/punto/segno ("18,5%" -> 18.5)"""
+    s = _as_text(col).str.replace(',', '.', regex=False).str.replace(r'[^\d\.-]', '', regex=True)
+    return pd.to_numeric(s, errors='coerce').fillna(0.0).astype(float)
+
+def to_number_column(col):
+    """Primo numero trovato dopo aver tolto kg/cm ("72,5 kg" -> 72.5)"""
+    s = _as_text(col).str.lower().str.replace(',', '.', regex=False)
+    s = s.str.replace('kg', '', regex=False).str.replace('cm', '', regex=False).str.strip()
+    return pd.to_numeric(s.str.extract(NUMBER_PATTERN, expand=False), errors='coerce').fillna(0.0).astype(float)
+
+def to_datetime_column(col):
+    """Date dei moduli ("15/01/2024 10:23", "2024-01-15 10:23:11"...) -> datetime, giorno prima del mese; NaT se illeggibile"""
+    s = _as_text(col).str.strip()
+    # Prima l'ISO (anno in testa, dayfirst lo invertirebbe), poi il formato italiano
+    iso = pd.to_datetime(s, format='ISO8601', errors='coerce', utc=True)
+    parsed = iso.fillna(pd.to_datetime(s, dayfirst=True, format='mixed', errors='coerce', utc=True))
+    return parsed.dt.tz_localize(None)
+
+def resolve_columns(headers, keywords_map):
+    """
+    Risolve UNA volta per foglio etichetta -> colonna, con le regole della vecchia ricerca riga per riga:
+    per ogni keyword (in ordine) la prima intestazione che la contiene (confronto normalizzato).
+    Ritorna {etichetta: nome colonna o None}.
+    """
+    # Come il dict {normalize_key(k): v}: ordine della prima occorrenza, colonna dell'ultima
+    norm_cols = {}
+    for h in headers: norm_cols[normalize_key(h)] = h
+
+    resolved = {}
+    for label, keywords in keywords_map.items():
+        resolved[label] = None
+        for kw in keywords:
+            kw_norm = normalize_key(kw)
+            found = next((col for k_norm, col in norm_cols.items() if kw_norm in k_norm), None)
+            if found is not None:
+                resolved[label] = found
+                break
+    return resolved
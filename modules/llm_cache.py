@@ -0,0 +1,108 @@
+import json
+import time
+import hashlib
+import sqlite3
+from modules.local_db import open_db
+
+# ==============================================================================
+# CACHE PERSISTENTE DELLE RISPOSTE AI
+# Chiave = hash di modello + parametri + messaggi: stesso prompt -> stessa risposta
+# senza nuova chiamata (e senza costo). Le voci scadono dopo TTL e, oltre
+# MAX_BYTES, si eliminano le meno usate. force=True ignora la cache e la riscrive.
+# ==============================================================================
+
+TTL = 30 * 24 * 3600           # Una risposta vale 30 giorni
+MAX_BYTES = 50 * 1024 * 1024   # Tetto del testo in cache (50 MB)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_used ON llm_cache(used_at);
+"""
+
+def cache_key(model, messages, **params):
+    payload = json.dumps({"model": model, "messages": messages, "params": params},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get(key):
+    """Testo in cache (None se assente o scaduto)"""
+    now = time.time()
+    with open_db(SCHEMA) as conn:
+        row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None: return None
+        if now - row[1] > TTL:
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE llm_cache SET used_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+def put(key, model, text):
+    now = time.time()
+    with open_db(SCHEMA) as conn:
+        conn.execute("INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                     (key, model, text, len(text.encode("utf-8")), now, now))
+        _evict(conn, now)
+
+def _evict(conn, now):
+    conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - TTL,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+    if total <= MAX_BYTES: return
+    for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY used_at").fetchall():
+        if total <= MAX_BYTES: break
+        conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+        total -= size
+
+def clear():
+    with open_db(SCHEMA) as conn: conn.execute("DELETE FROM llm_cache")
+
+def cached_completion(client, model, messages, force=False, **params):
+    """
+    Come client.chat.completions.create(...).choices[0].message.content, ma con cache su disco.
+    Un errore della cache non blocca mai la chiamata: si va semplicemente su OpenAI.
+    """
+    key = cache_key(model, messages, **params)
+    if not force:
+        try:
+            hit = get(key)
+            if hit is not None: return hit
+        except sqlite3.Error: pass
+
+    response = client.chat.completions.create(model=model, messages=messages, **params)
+    text = response.choices[0].message.content
+    if text:
+        try: put(key, model, text)
+        except sqlite3.Error: pass
+    return text
+
+def cached_stream(client, model, messages, force=False, **params):
+    """
+    Come cached_completion, ma genera il testo a pezzi man mano che arriva (stream=True).
+    Da cache esce in un solo pezzo. Si salva in cache solo una risposta arrivata per intero.
+    """
+    key = cache_key(model, messages, **params)
+    if not force:
+        try:
+            hit = get(key)
+            if hit is not None:
+                yield hit
+                return
+        except sqlite3.Error: pass
+
+    parts = []
+    for chunk in client.chat.completions.create(model=model, messages=messages, stream=True, **params):
+        if not chunk.choices: continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+    text = "".join(parts)
+    if text:
+        try: put(key, model, text)
+        except sqlite3.Error: pass
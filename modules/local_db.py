@@ -0,0 +1,28 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+# Cartella dati locali dell'HUB (mirror, code, indici). Condivisa da tutti i worker della stessa macchina.
+CACHE_DIR = os.environ.get("AREA199_CACHE_DIR", ".area199_cache")
+DB_NAME = "hub.sqlite"
+
+def cache_path(*parts):
+    """Percorso dentro la cartella cache (la crea se manca)"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, *parts)
+
+@contextmanager
+def open_db(schema=None, name=DB_NAME):
+    """
+    Connessione SQLite breve (una per operazione): sicura tra thread e processi.
+    'schema' (CREATE ... IF NOT EXISTS) viene applicato prima di aprire la transazione.
+    Il blocco 'with' è una transazione: commit a fine blocco, rollback su errore.
+    """
+    conn = sqlite3.connect(cache_path(name), timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        if schema: conn.executescript(schema)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# MOTORE STORICO MISURE (pannello CONTROLLO del coach)
+# Lo storico diventa UNA tabella indicizzata per data (ordinata); variazioni,
+# velocità di cambiamento e asimmetrie Sx/Dx si calcolano per colonne in un
+# solo passaggio, qualunque sia il numero di check-up.
+# ==============================================================================
+
+ASYMMETRY_PAIRS = {"Braccio": ("Braccio Sx", "Braccio Dx"), "Coscia": ("Coscia Sx", "Coscia Dx"),
+                   "Polpaccio": ("Polpaccio Sx", "Polpaccio Dx")}
+RATE_WINDOW = "56D" # Finestra della media mobile della velocità (8 settimane)
+
+def history_frame(history, metrics):
+    """
+    Voci di get_full_history -> DataFrame con indice 'Date' (datetime, NaT se illeggibile) ordinato,
+    una colonna numerica per metrica e la colonna 'Source'.
+    """
+    df = pd.DataFrame(history)
+    if df.empty: return pd.DataFrame(columns=list(metrics) + ["Source"], index=pd.DatetimeIndex([], name="Date"))
+    dates = pd.to_datetime(df["Date_parsed"] if "Date_parsed" in df else pd.Series(pd.NaT, index=df.index), errors="coerce")
+    out = df.reindex(columns=list(metrics)).apply(pd.to_numeric, errors="coerce").fillna(0.0)
+    out["Source"] = df["Source"] if "Source" in df else ""
+    out.index = pd.DatetimeIndex(dates, name="Date")
+    # Date illeggibili in testa (come datetime.min), ordine stabile a parità di data
+    order = np.lexsort((np.arange(len(out)), out.index.fillna(pd.Timestamp.min).values))
+    return out.iloc[order]
+
+def latest_deltas(frame, metrics):
+    """Per ogni metrica con valore attuale > 0: attuale, precedente, iniziale e differenze"""
+    values = frame[list(metrics)].to_numpy(dtype=float)
+    if not len(values): return pd.DataFrame(columns=["current", "previous", "start", "delta_prev", "delta_start"])
+    curr = values[-1]
+    prev = values[-2] if len(values) > 1 else values[0]
+    start = values[0]
+    table = pd.DataFrame({"current": curr, "previous": prev, "start": start,
+                          "delta_prev": curr - prev, "delta_start": curr - start}, index=list(metrics))
+    return table[table["current"] > 0]
+
+def measured(frame, metrics):
+    """Solo le misure reali: 0 (campo vuoto nel modulo) -> NaN, righe senza data escluse"""
+    dated = frame[frame.index.notna()]
+    return dated[list(metrics)].replace(0.0, np.nan)
+
+def rolling_rates(frame, metrics, window=RATE_WINDOW):
+    """Variazione per settimana tra check-up consecutivi, media mobile su 'window'"""
+    values = measured(frame, metrics)
+    if len(values) < 2: return values.iloc[0:0]
+    days = values.index.to_series().diff().dt.total_seconds() / 86400.0
+    per_week = values.diff().div(days.where(days > 0), axis=0) * 7.0
+    return per_week.rolling(window, min_periods=1).mean()
+
+def asymmetries(frame):
+    """Asimmetria % (Dx - Sx) / media per coppia, NaN se manca uno dei due lati"""
+    out = pd.DataFrame(index=frame.index)
+    for label, (sx_col, dx_col) in ASYMMETRY_PAIRS.items():
+        if sx_col not in frame or dx_col not in frame: continue
+        sx = frame[sx_col].where(frame[sx_col] > 0)
+        dx = frame[dx_col].where(frame[dx_col] > 0)
+        out[label] = (dx - sx) / ((dx + sx) / 2.0) * 100.0
+    return out
+
+def analyze(history, metrics):
+    """Tutto il pannello in un passaggio: tabella, variazioni, velocità, asimmetrie"""
+    frame = history_frame(history, metrics)
+    return {
+        "frame": frame,
+        "deltas": latest_deltas(frame, metrics),
+        "trends": measured(frame, metrics),
+        "rates": rolling_rates(frame, metrics),
+        "asymmetry": asymmetries(frame[frame.index.notna()]),
+    }
@@ -0,0 +1,202 @@
+import json
+import re
+import datetime
+import unicodedata
+from rapidfuzz import process, fuzz
+from modules.local_db import open_db
+
+# ==============================================================================
+# MIRROR LOCALE DEI FOGLI APPEND-ONLY (es. BIVA_LOGS)
+# Il foglio cresce solo in coda: teniamo una copia su SQLite e scarichiamo
+# soltanto le righe aggiunte dopo l'ultima sincronizzazione (high-water mark).
+# ==============================================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mirror_meta (
+    sheet TEXT PRIMARY KEY,
+    headers TEXT NOT NULL,
+    high_water INTEGER NOT NULL,
+    synced_at TEXT
+);
+CREATE TABLE IF NOT EXISTS mirror_rows (
+    sheet TEXT NOT NULL,
+    row_num INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (sheet, row_num)
+);
+CREATE TABLE IF NOT EXISTS mirror_keys (
+    sheet TEXT NOT NULL,
+    row_num INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (sheet, row_num)
+);
+CREATE INDEX IF NOT EXISTS idx_mirror_keys ON mirror_keys (sheet, key);
+"""
+
+FUZZY_MIN_SCORE = 85 # Soglia dei nomi simili proposti all'operatore (mai usati senza conferma)
+FUZZY_MAX_SUGGESTIONS = 3
+
+def normalize_name(name):
+    """Chiave indice: minuscolo, senza accenti, spazi multipli collassati ("  Nicolò  Rossi" -> "nicolo rossi")"""
+    s = unicodedata.normalize("NFKD", str(name))
+    s = "".join(c for c in s if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", s).strip().lower()
+
+def _key_column(headers, key_headers):
+    for i, h in enumerate(headers):
+        if h.lower() in key_headers: return i
+    return None
+
+def _trim(row):
+    """Toglie le celle vuote in coda (Sheets non le restituisce sempre)"""
+    row = [str(v) for v in row]
+    while row and row[-1] == "": row.pop()
+    return row
+
+def _load_meta(conn, sheet):
+    cur = conn.execute("SELECT headers, high_water FROM mirror_meta WHERE sheet = ?", (sheet,))
+    found = cur.fetchone()
+    if not found: return [], 0
+    return json.loads(found[0]), found[1]
+
+def _stored_row(conn, sheet, row_num):
+    cur = conn.execute("SELECT data FROM mirror_rows WHERE sheet = ? AND row_num = ?", (sheet, row_num))
+    found = cur.fetchone()
+    return json.loads(found[0]) if found else None
+
+def _index_row(conn, sheet, row_num, row, key_col):
+    if key_col is None: return
+    value = row[key_col] if key_col < len(row) else ""
+    conn.execute("INSERT OR REPLACE INTO mirror_keys (sheet, row_num, key) VALUES (?, ?, ?)",
+                 (sheet, row_num, normalize_name(value)))
+
+def store_rows(conn, sheet, first_row, rows, key_headers=None):
+    """
+    Scrive nel mirror le righe del foglio a partire dal numero di riga 'first_row' (1 = intestazione).
+    Con 'key_headers' (nomi colonna ammessi, minuscoli) aggiorna anche l'indice nome -> righe.
+    """
+    headers, high_water = _load_meta(conn, sheet)
+    key_col = _key_column(headers, key_headers or [])
+    for offset, row in enumerate(rows):
+        row_num = first_row + offset
+        if row_num == 1:
+            headers = [str(h).strip() for h in row]
+            key_col = _key_column(headers, key_headers or [])
+            continue
+        row = _trim(row)
+        conn.execute("INSERT OR REPLACE INTO mirror_rows (sheet, row_num, data) VALUES (?, ?, ?)",
+                     (sheet, row_num, json.dumps(row)))
+        _index_row(conn, sheet, row_num, row, key_col)
+    last_row = first_row + len(rows) - 1
+    conn.execute("INSERT OR REPLACE INTO mirror_meta (sheet, headers, high_water, synced_at) VALUES (?, ?, ?, ?)",
+                 (sheet, json.dumps(headers), max(high_water, last_row), datetime.datetime.now().isoformat()))
+
+def reset(sheet):
+    """Svuota il mirror di un foglio (la prossima sync lo riscarica intero)"""
+    with open_db(SCHEMA) as conn:
+        conn.execute("DELETE FROM mirror_rows WHERE sheet = ?", (sheet,))
+        conn.execute("DELETE FROM mirror_keys WHERE sheet = ?", (sheet,))
+        conn.execute("DELETE FROM mirror_meta WHERE sheet = ?", (sheet,))
+
+def _ensure_index(conn, sheet, key_headers):
+    """Costruisce l'indice per un mirror che ne è ancora privo (una volta sola, tutto in locale)"""
+    has_rows = conn.execute("SELECT 1 FROM mirror_rows WHERE sheet = ? LIMIT 1", (sheet,)).fetchone()
+    has_keys = conn.execute("SELECT 1 FROM mirror_keys WHERE sheet = ? LIMIT 1", (sheet,)).fetchone()
+    if not has_rows or has_keys: return
+    headers, _ = _load_meta(conn, sheet)
+    key_col = _key_column(headers, key_headers)
+    for row_num, data in conn.execute("SELECT row_num, data FROM mirror_rows WHERE sheet = ?", (sheet,)).fetchall():
+        _index_row(conn, sheet, row_num, json.loads(data), key_col)
+
+def sync(sheet, table, key_headers=None):
+    """
+    Porta il mirror in pari con il foglio e ritorna il numero di righe nuove.
+    Scarica dall'ultima riga nota in poi: quella riga fa da controllo di coerenza.
+    Se non coincide più (righe cancellate/modificate a mano) si riparte da zero.
+    """
+    with open_db(SCHEMA) as conn:
+        if key_headers: _ensure_index(conn, sheet, key_headers)
+        _, high_water = _load_meta(conn, sheet)
+        known_last = _stored_row(conn, sheet, high_water) if high_water > 1 else None
+
+    start = max(high_water, 1)
+    fetched = table.get_values(start)
+
+    if high_water > 1 and (not fetched or _trim(fetched[0]) != known_last):
+        reset(sheet)
+        high_water, start = 0, 1
+        fetched = table.get_values(1)
+
+    if fetched:
+        with open_db(SCHEMA) as conn:
+            store_rows(conn, sheet, start, fetched, key_headers)
+    last_row = start + len(fetched) - 1
+    return max(last_row - max(high_water, 1), 0)
+
+def headers(sheet):
+    """Intestazioni viste all'ultima sincronizzazione ([] se il mirror è vuoto)"""
+    with open_db(SCHEMA) as conn:
+        return _load_meta(conn, sheet)[0]
+
+def read(sheet):
+    """Ritorna (intestazioni, righe) dal mirror locale, righe allineate alla larghezza dell'intestazione"""
+    with open_db(SCHEMA) as conn:
+        headers, _ = _load_meta(conn, sheet)
+        cur = conn.execute("SELECT data FROM mirror_rows WHERE sheet = ? ORDER BY row_num", (sheet,))
+        rows = [json.loads(r[0]) for r in cur.fetchall()]
+    width = len(headers)
+    return headers, [(r + [""] * width)[:width] for r in rows]
+
+def record_append(sheet, first_row, rows, key_headers=None):
+    """
+    Registra nel mirror righe appena scritte sul foglio (es. da save_visit), senza riscaricarle.
+    Solo se sono contigue al mirror: altrimenti ci pensa la prossima sync.
+    """
+    with open_db(SCHEMA) as conn:
+        _, high_water = _load_meta(conn, sheet)
+        if high_water < 1 or first_row != high_water + 1: return False
+        store_rows(conn, sheet, first_row, rows, key_headers)
+    return True
+
+def resolve_key(sheet, name):
+    """
+    Chiave indice per un nome digitato: SOLO match esatto normalizzato (accenti, maiuscole, spazi).
+    Un nome simile può essere un altro paziente ("Maria Rossi" / "Mario Rossi"): vedi suggest.
+    """
+    key = normalize_name(name)
+    if not key: return None
+    with open_db(SCHEMA) as conn:
+        found = conn.execute("SELECT 1 FROM mirror_keys WHERE sheet = ? AND key = ? LIMIT 1", (sheet, key)).fetchone()
+    return key if found else None
+
+def suggest(sheet, name, key_headers, limit=FUZZY_MAX_SUGGESTIONS):
+    """
+    Nomi simili presenti nell'indice (ordine nome/cognome, refusi), come scritti nell'ultima visita.
+    Solo proposte da far confermare all'operatore: lookup non li usa mai da solo.
+    """
+    key = normalize_name(name)
+    if not key: return []
+    with open_db(SCHEMA) as conn:
+        headers, _ = _load_meta(conn, sheet)
+        latest = dict(conn.execute("SELECT key, MAX(row_num) FROM mirror_keys WHERE sheet = ? GROUP BY key", (sheet,)).fetchall())
+        matches = process.extract(key, [k for k in latest if k and k != key], scorer=fuzz.token_sort_ratio,
+                                  score_cutoff=FUZZY_MIN_SCORE, limit=limit)
+        key_col = _key_column(headers, key_headers)
+        names = []
+        for match_key, _, _ in matches:
+            row = _stored_row(conn, sheet, latest[match_key]) or []
+            names.append(row[key_col].strip() if key_col is not None and key_col < len(row) else match_key)
+    return names
+
+def lookup(sheet, name):
+    """Ritorna (intestazioni, righe) del solo nome richiesto, leggendo le righe via indice"""
+    key = resolve_key(sheet, name)
+    with open_db(SCHEMA) as conn:
+        headers, _ = _load_meta(conn, sheet)
+        if key is None: return headers, []
+        cur = conn.execute(
+            "SELECT r.data FROM mirror_keys k JOIN mirror_rows r ON r.sheet = k.sheet AND r.row_num = k.row_num "
+            "WHERE k.sheet = ? AND k.key = ? ORDER BY k.row_num", (sheet, key))
+        rows = [json.loads(r[0]) for r in cur.fetchall()]
+    width = len(headers)
+    return headers, [(r + [""] * width)[:width] for r in rows]
@@ -130,6 +130,11 @@ class BivaReportPDF(FPDF):
         if body_map_path: self.image(body_map_path, x=140, y=y, w=50)
         
         self.ln(65)
+        if data.get('BIVA_Class'):
+            self.set_font('Arial', 'I', 8)
+            self.set_text_color(80)
+            self.multi_cell(0, 4, self.sanitize(data['BIVA_Class']))
+            self.set_text_color(0)
         self.add_page()
         
         self.section_title("RELAZIONE TECNICA & STRATEGIA")
@@ -0,0 +1,78 @@
+import re
+import zlib
+import base64
+from functools import lru_cache
+
+# ==============================================================================
+# FORMATO COMPATTO DEI JSON IN SCHEDE_ATTIVE
+# Cella = "z1:" + base64(zlib(json)). Se supera il limite di cella di Google Sheets
+# il testo prosegue in celle extra in coda alla riga: "z1@<colonna>+<quante>:" dice dove
+# (colonna assoluta della prima cella di continuazione, 0 = A: vale qualunque sia l'intestazione).
+# Le righe vecchie (JSON in chiaro) restano leggibili: ciò che non ha il tag passa invariato.
+# ==============================================================================
+
+TAG = "z1"
+CELL_LIMIT = 49000 # Google Sheets: max 50.000 caratteri per cella (margine per il tag)
+MARKER_RE = re.compile(r"^z1(?:@(\d+)\+(\d+))?:")
+
+def encode_row(cells, payloads, extra_from=0):
+    """
+    Riga da salvare: 'cells' invariate, poi un valore per ogni payload JSON (compresso se conviene),
+    poi gli eventuali pezzi di continuazione dei payload troppo lunghi, non prima della colonna
+    'extra_from' (0 = A; di solito la larghezza dell'intestazione, per non finire sotto altre colonne).
+    """
+    row, extra = list(cells), []
+    extra_start = max(len(cells) + len(payloads), extra_from)
+    for text in payloads:
+        if not text:
+            row.append("")
+            continue
+        packed = base64.b64encode(zlib.compress(text.encode("utf-8"), 9)).decode("ascii")
+        if len(text) <= CELL_LIMIT and len(text) <= len(packed) + len(TAG) + 1:
+            row.append(text) # JSON minuscolo: compresso sarebbe più lungo
+        elif len(packed) <= CELL_LIMIT:
+            row.append(f"{TAG}:{packed}")
+        else:
+            parts = [packed[i:i + CELL_LIMIT] for i in range(0, len(packed), CELL_LIMIT)]
+            row.append(f"{TAG}@{extra_start + len(extra)}+{len(parts) - 1}:{parts[0]}")
+            extra.extend(parts[1:])
+    if not extra: return row
+    return row + [""] * (extra_start - len(row)) + extra
+
+@lru_cache(maxsize=256)
+def _inflate(packed):
+    return zlib.decompress(base64.b64decode(packed)).decode("utf-8")
+
+def decode_value(value, row=()):
+    """Valore di cella -> JSON in chiaro ('row' = riga completa, per i payload a pezzi)"""
+    value = "" if value is None else str(value)
+    m = MARKER_RE.match(value)
+    if not m: return value
+    packed = value[m.end():]
+    if m.group(1) is not None:
+        start, count = int(m.group(1)), int(m.group(2))
+        parts = [str(v) for v in row[start:start + count]]
+        if len(parts) != count: raise ValueError("Scheda incompleta: mancano celle di continuazione")
+        packed += "".join(parts)
+    return _inflate(packed)
+
+def decode_record(headers, row, columns):
+    """Riga grezza -> {intestazione: valore}, con i JSON compressi delle sole 'columns' già espansi"""
+    values = (list(row) + [""] * len(headers))[:len(headers)]
+    return {h: decode_value(v, row) if h in columns else v for h, v in zip(headers, values)}
+
+if __name__ == "__main__":
+    # python -m modules.plan_codec  ->  controllo di andata/ritorno con intestazioni di larghezza diversa
+    import json, random
+    random.seed(199)
+    big = json.dumps({"days": ["".join(random.choice("abcdefghij0123456789") for _ in range(60000)) for _ in range(3)]})
+    for headers in (["Data", "Email", "Nome", "Commento", "JSON_Scheda", "JSON_Dieta"],
+                    ["Data", "Email", "Nome", "Commento", "JSON_Scheda", "JSON_Dieta", "JSON_Completo"],
+                    ["Data", "Email", "Nome", "Commento", "JSON_Scheda", "JSON_Dieta", "Stato", "Note", "Extra"]):
+        for payloads in (["", ""], ['{"a": 1}', ""], [big, '{"b": 2}'], [big, big]):
+            row = encode_row(["d", "e", "n", "c"], payloads, len(headers))
+            assert all(len(str(v)) <= CELL_LIMIT + 20 for v in row)
+            record = decode_record(headers, row, ("JSON_Scheda", "JSON_Dieta", "JSON_Completo"))
+            assert [record["JSON_Scheda"], record["JSON_Dieta"]] == payloads, (len(headers), [len(p) for p in payloads])
+            assert all(record[h] == "" for h in headers[6:]), "continuazione sotto un'intestazione"
+        print(f"{len(headers)} colonne: ok")
@@ -0,0 +1,68 @@
+import json
+import hashlib
+from functools import lru_cache
+from string import Template
+
+# ==============================================================================
+# EXPORT HTML DI SCHEDA E DIETA (file scaricabile)
+# Template compilati una volta all'import; l'HTML viene generato una sola volta per
+# contenuto (hash del JSON) e servito con st.download_button, non come data-URI nella pagina.
+# ==============================================================================
+
+WORKOUT_PAGE = Template("""<html><head><style>body{font-family:Arial;padding:20px;} h1{color:#E20613;} .session{margin-top:20px;border-bottom:2px solid #333;} .ex{margin-bottom:10px;}</style></head><body><h1>SCHEDA ALLENAMENTO - AREA 199</h1>$sessions$note</body></html>""")
+WORKOUT_SESSION = Template("<div class='session'><h2>$name</h2>$exercises</div>")
+WORKOUT_EXERCISE = Template("<div class='ex'><strong>$name</strong><br>$details<br><em>$note</em></div>")
+WORKOUT_NOTE = Template("<div style='margin-top:20px; border:1px solid #E20613; padding:10px;'><strong>NOTE COACH:</strong><br>$note</div>")
+
+DIET_PAGE = Template("""<html><head><style>body{font-family:Arial;padding:20px;} h1{color:#4ade80;} h2{color:#60a5fa;} .meal{margin-bottom:10px;padding-left:10px;border-left:3px solid #4ade80;}</style></head><body><h1>PIANO ALIMENTARE</h1><p>Target: $calories | Acqua: $water</p>$days$note$supplements</body></html>""")
+DIET_DAY = Template("<h3>$name</h3>$meals")
+DIET_MEAL = Template("<div class='meal'><strong>$name</strong><br>$foods<br><em>$notes</em></div>")
+DIET_NOTE = Template("<br><strong>NOTE DIETA:</strong> $note")
+DIET_SUPPLEMENTS = Template("<h2>INTEGRAZIONE</h2><ul>$items</ul>")
+DIET_SUPPLEMENT = Template("<li><strong>$name</strong>: $dose ($timing) - <em>$notes</em></li>")
+
+def _canonical(data):
+    """JSON stabile (ordine delle chiavi ininfluente): chiave della cache"""
+    return json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+
+def _digest(canonical):
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]
+
+@lru_cache(maxsize=64)
+def _workout_html(canonical):
+    plan_json = json.loads(canonical)
+    sessions = "".join(
+        WORKOUT_SESSION.substitute(
+            name=s.get('name', 'Sessione'),
+            exercises="".join(WORKOUT_EXERCISE.substitute(name=ex.get('name', 'Ex'), details=ex.get('details', ''), note=ex.get('note', ''))
+                              for ex in s.get('exercises', [])))
+        for s in plan_json.get('sessions', plan_json.get('Sessions', [])))
+    note = WORKOUT_NOTE.substitute(note=plan_json['note_coach']) if plan_json.get('note_coach') else ""
+    return WORKOUT_PAGE.substitute(sessions=sessions, note=note).encode("utf-8")
+
+@lru_cache(maxsize=64)
+def _diet_html(canonical):
+    diet_json = json.loads(canonical)
+    days = "".join(
+        DIET_DAY.substitute(
+            name=day.get('day_name'),
+            meals="".join(DIET_MEAL.substitute(name=m.get('name'), foods=', '.join(m.get('foods', [])), notes=m.get('notes', ''))
+                          for m in day.get('meals', [])))
+        for day in diet_json.get('days', []))
+    note = DIET_NOTE.substitute(note=diet_json['diet_note']) if diet_json.get('diet_note') else ""
+    supps = diet_json.get('supplements', [])
+    supplements = DIET_SUPPLEMENTS.substitute(items="".join(
+        DIET_SUPPLEMENT.substitute(name=s.get('name'), dose=s.get('dose'), timing=s.get('timing'), notes=s.get('notes', ''))
+        for s in supps)) if supps else ""
+    return DIET_PAGE.substitute(calories=diet_json.get('daily_calories', ''), water=diet_json.get('water_intake', ''),
+                                days=days, note=note, supplements=supplements).encode("utf-8")
+
+def workout_export(plan_json):
+    """(hash, bytes HTML) della scheda: rigenerato solo se il contenuto cambia"""
+    canonical = _canonical(plan_json)
+    return _digest(canonical), _workout_html(canonical)
+
+def diet_export(diet_json):
+    """(hash, bytes HTML) del piano nutrizionale: rigenerato solo se il contenuto cambia"""
+    canonical = _canonical(diet_json)
+    return _digest(canonical), _diet_html(canonical)
@@ -0,0 +1,117 @@
+import json
+import datetime
+from modules.local_db import open_db
+
+# ==============================================================================
+# INDICE "ULTIMA SCHEDA PER ATLETA" (SCHEDE_ATTIVE)
+# email -> numero di riga dell'ultimo piano inviato. Si aggiorna scaricando la sola
+# colonna Email delle righe nuove (o dall'hook della coda quando il coach invia);
+# il login dell'atleta legge UNA riga, qualunque sia lo storico totale.
+# ==============================================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plan_index_meta (
+    sheet TEXT PRIMARY KEY,
+    headers TEXT NOT NULL,
+    email_col INTEGER,
+    high_water INTEGER NOT NULL,
+    last_email TEXT NOT NULL,
+    synced_at TEXT
+);
+CREATE TABLE IF NOT EXISTS plan_index (
+    sheet TEXT NOT NULL,
+    email TEXT NOT NULL,
+    row_num INTEGER NOT NULL,
+    PRIMARY KEY (sheet, email)
+);
+"""
+
+EMAIL_HEADERS = ["email", "e-mail"]
+
+def _clean(email):
+    return str(email or "").strip().lower()
+
+def _load_meta(conn, sheet):
+    found = conn.execute("SELECT headers, email_col, high_water, last_email FROM plan_index_meta WHERE sheet = ?", (sheet,)).fetchone()
+    if not found: return [], None, 0, ""
+    return json.loads(found[0]), found[1], found[2], found[3]
+
+def _save_meta(conn, sheet, headers, email_col, high_water, last_email):
+    conn.execute("INSERT OR REPLACE INTO plan_index_meta (sheet, headers, email_col, high_water, last_email, synced_at) VALUES (?, ?, ?, ?, ?, ?)",
+                 (sheet, json.dumps(headers), email_col, high_water, last_email, datetime.datetime.now().isoformat()))
+
+def _point(conn, sheet, first_row, emails):
+    """Ogni email punta alla sua riga più recente"""
+    for offset, email in enumerate(emails):
+        email = _clean(email)
+        if not email: continue
+        conn.execute("INSERT INTO plan_index (sheet, email, row_num) VALUES (?, ?, ?) "
+                     "ON CONFLICT(sheet, email) DO UPDATE SET row_num = MAX(row_num, excluded.row_num)",
+                     (sheet, email, first_row + offset))
+
+def reset(sheet):
+    with open_db(SCHEMA) as conn:
+        conn.execute("DELETE FROM plan_index WHERE sheet = ?", (sheet,))
+        conn.execute("DELETE FROM plan_index_meta WHERE sheet = ?", (sheet,))
+
+def sync(sheet, table):
+    """
+    Porta l'indice in pari scaricando solo la colonna Email dall'ultima riga nota in poi.
+    L'ultima riga nota fa da controllo: se non coincide (righe cancellate a mano) si ricostruisce.
+    """
+    with open_db(SCHEMA) as conn:
+        headers, email_col, high_water, last_email = _load_meta(conn, sheet)
+
+    if email_col is None:
+        header = table.get_values(1, 1)
+        if not header: return
+        headers = [str(h).strip() for h in header[0]]
+        low = [h.lower() for h in headers]
+        email_col = next((low.index(h) + 1 for h in EMAIL_HEADERS if h in low), None)
+        if email_col is None: raise KeyError("Colonna Email non trovata")
+        high_water, last_email = 1, ""
+
+    start = high_water
+    emails = table.get_columns([email_col], start)[0]
+    if start > 1 and (not emails or _clean(emails[0]) != last_email):
+        reset(sheet)
+        return sync(sheet, table)
+
+    with open_db(SCHEMA) as conn:
+        _point(conn, sheet, start + 1, emails[1:])
+        if len(emails) > 1: high_water, last_email = start + len(emails) - 1, _clean(emails[-1])
+        _save_meta(conn, sheet, headers, email_col, high_water, last_email)
+
+def record_append(sheet, first_row, rows):
+    """Righe appena scritte dalla coda (es. invio scheda): aggiorna l'indice senza riscaricare"""
+    with open_db(SCHEMA) as conn:
+        headers, email_col, high_water, _ = _load_meta(conn, sheet)
+        if email_col is None or first_row != high_water + 1: return False
+        emails = [row[email_col - 1] if len(row) >= email_col else "" for row in rows]
+        _point(conn, sheet, first_row, emails)
+        _save_meta(conn, sheet, headers, email_col, first_row + len(rows) - 1, _clean(emails[-1]))
+    return True
+
+def headers(sheet):
+    """Intestazioni del foglio viste all'ultima sincronizzazione ([] se mai sincronizzato)"""
+    with open_db(SCHEMA) as conn:
+        return _load_meta(conn, sheet)[0]
+
+def latest(sheet, table, email):
+    """
+    Ultimo piano dell'atleta come (intestazioni, riga completa), None se non ne ha.
+    Legge una sola riga; se la riga non appartiene più all'email l'indice viene ricostruito.
+    """
+    clean_email = _clean(email)
+    sync(sheet, table)
+    for attempt in range(2):
+        with open_db(SCHEMA) as conn:
+            headers, email_col, _, _ = _load_meta(conn, sheet)
+            found = conn.execute("SELECT row_num FROM plan_index WHERE sheet = ? AND email = ?", (sheet, clean_email)).fetchone()
+        if not found: return None
+        fetched = table.get_values(found[0], found[0])
+        row = fetched[0] if fetched else []
+        if len(row) >= email_col and _clean(row[email_col - 1]) == clean_email: return headers, row
+        reset(sheet)
+        sync(sheet, table)
+    return None
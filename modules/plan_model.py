@@ -0,0 +1,167 @@
+import ast
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+
+# ==============================================================================
+# MODELLO DI SCHEDA E DIETA
+# Il JSON (dall'AI, dal parser locale o da SCHEDE_ATTIVE) viene validato e
+# normalizzato UNA volta: chiavi alternative, valori mancanti, tipi sbagliati.
+# Le card leggono attributi certi, senza .get() difensivi.
+# ==============================================================================
+
+def _text(value, default=""):
+    return default if value is None else str(value)
+
+def _items(value):
+    """Solo gli elementi dizionario di una lista (il resto è rumore dell'AI)"""
+    return [v for v in value if isinstance(v, dict)] if isinstance(value, list) else []
+
+@dataclass(frozen=True, slots=True)
+class Exercise:
+    name: str
+    search_name: str
+    details: str
+    note: str
+    images: tuple
+    debug_info: str
+
+    @classmethod
+    def from_dict(cls, d):
+        images = d.get('images') or []
+        return cls(name=_text(d.get('name')), search_name=_text(d.get('search_name')),
+                   details=_text(d.get('details')), note=_text(d.get('note')),
+                   images=tuple(str(i) for i in images) if isinstance(images, list) else (),
+                   debug_info=_text(d.get('debug_info'), 'N/A'))
+
+    def to_dict(self):
+        return {"name": self.name, "search_name": self.search_name, "details": self.details, "note": self.note,
+                "images": list(self.images), "debug_info": self.debug_info}
+
+@dataclass(frozen=True, slots=True)
+class Session:
+    name: str
+    exercises: tuple
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(name=_text(d.get('name', d.get('Name')), 'Sessione'),
+                   exercises=tuple(Exercise.from_dict(ex) for ex in _items(d.get('exercises'))))
+
+    def to_dict(self):
+        return {"name": self.name, "exercises": [ex.to_dict() for ex in self.exercises]}
+
+@dataclass(frozen=True, slots=True)
+class Plan:
+    sessions: tuple
+    note_coach: str
+
+    @classmethod
+    def from_dict(cls, d):
+        if not isinstance(d, dict): raise ValueError("Scheda non valida")
+        return cls(sessions=tuple(Session.from_dict(s) for s in _items(d.get('sessions', d.get('Sessions')))),
+                   note_coach=_text(d.get('note_coach')))
+
+    def to_dict(self):
+        return {"sessions": [s.to_dict() for s in self.sessions], "note_coach": self.note_coach}
+
+@dataclass(frozen=True, slots=True)
+class Meal:
+    name: str
+    foods: tuple
+    notes: str
+
+    @classmethod
+    def from_dict(cls, d):
+        foods = d.get('foods') or []
+        foods = tuple(str(f) for f in foods) if isinstance(foods, list) else (str(foods),)
+        return cls(name=_text(d.get('name'), 'Pasto'), foods=foods, notes=_text(d.get('notes')))
+
+    def to_dict(self):
+        return {"name": self.name, "foods": list(self.foods), "notes": self.notes}
+
+@dataclass(frozen=True, slots=True)
+class Day:
+    name: str
+    meals: tuple
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(name=_text(d.get('day_name'), 'Giornata Tipo'),
+                   meals=tuple(Meal.from_dict(m) for m in _items(d.get('meals'))))
+
+    def to_dict(self):
+        return {"day_name": self.name, "meals": [m.to_dict() for m in self.meals]}
+
+@dataclass(frozen=True, slots=True)
+class Supplement:
+    name: str
+    dose: str
+    timing: str
+    notes: str
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(name=_text(d.get('name')), dose=_text(d.get('dose')),
+                   timing=_text(d.get('timing')), notes=_text(d.get('notes')))
+
+    def to_dict(self):
+        return {"name": self.name, "dose": self.dose, "timing": self.timing, "notes": self.notes}
+
+@dataclass(frozen=True, slots=True)
+class Diet:
+    daily_calories: str | None  # None = target non indicato (la card non mostra il riquadro)
+    water_intake: str | None
+    diet_note: str
+    days: tuple
+    supplements: tuple
+
+    @classmethod
+    def from_dict(cls, d):
+        if not isinstance(d, dict): raise ValueError("Piano nutrizionale non valido")
+        return cls(daily_calories=None if d.get('daily_calories') is None else str(d['daily_calories']),
+                   water_intake=None if d.get('water_intake') is None else str(d['water_intake']),
+                   diet_note=_text(d.get('diet_note')),
+                   days=tuple(Day.from_dict(day) for day in _items(d.get('days'))),
+                   supplements=tuple(Supplement.from_dict(s) for s in _items(d.get('supplements'))))
+
+    def to_dict(self):
+        out = {"diet_note": self.diet_note, "days": [day.to_dict() for day in self.days],
+               "supplements": [s.to_dict() for s in self.supplements]}
+        if self.daily_calories is not None: out["daily_calories"] = self.daily_calories
+        if self.water_intake is not None: out["water_intake"] = self.water_intake
+        return out
+
+def _decode(raw):
+    """Testo salvato -> dict: JSON, oppure repr Python delle righe più vecchie"""
+    try: return json.loads(raw)
+    except ValueError: pass
+    try: return ast.literal_eval(raw)
+    except (ValueError, SyntaxError) as e: raise ValueError(f"Contenuto illeggibile: {e}")
+
+@lru_cache(maxsize=256)
+def _plan_from_text(raw):
+    return Plan.from_dict(_decode(raw))
+
+@lru_cache(maxsize=256)
+def _diet_from_text(raw):
+    return Diet.from_dict(_decode(raw))
+
+def parse_plan(value):
+    """Plan da Plan/dict/testo salvato. Il testo è analizzato una volta sola (cache per contenuto della riga)."""
+    if isinstance(value, Plan): return value
+    if isinstance(value, str): return _plan_from_text(value)
+    return Plan.from_dict(value)
+
+def parse_diet(value):
+    """Diet da Diet/dict/testo salvato. Il testo è analizzato una volta sola (cache per contenuto della riga)."""
+    if isinstance(value, Diet): return value
+    if isinstance(value, str): return _diet_from_text(value)
+    return Diet.from_dict(value)
+
+def normalize_plan(plan_json):
+    """Forma canonica da salvare (write time): stesse chiavi e tipi per ogni scheda"""
+    return Plan.from_dict(plan_json).to_dict()
+
+def normalize_diet(diet_json):
+    return Diet.from_dict(diet_json).to_dict()
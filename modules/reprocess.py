@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from modules.calculations import calculate_advanced_metrics_batch, FORMULA_VERSION
+from modules.ingest import to_float_column
+from modules.storage import PATIENT_HEADERS
+
+# ==============================================================================
+# RICALCOLO DELL'ARCHIVIO BIVA_LOGS CON LE FORMULE ATTUALI
+#     python -m modules.reprocess [--backend sqlite --path store.sqlite] [--chunk 2000] [--workers N]
+# Legge BIVA_LOGS a blocchi, ricalcola i blocchi in parallelo (un processo per core,
+# formule a colonne) e scrive un tab derivato per versione: BIVA_DERIVED_<FORMULA_VERSION>.
+# Riprende da dove si era fermato: le righe già presenti nel tab derivato non si ricalcolano.
+# ==============================================================================
+
+SOURCE = ("AREA199_DB", "BIVA_LOGS")
+METRICS = ["PhA", "TBW_L", "ECW_L", "ICW_L", "FFM_kg", "FM_kg", "FM_perc", "BCM_kg", "SMM_kg", "BMR_kcal"]
+DERIVED_HEADERS = ["Riga", "Data", "Paziente", "Versione", "Stato"] + METRICS
+
+STATUS_OK = "ok"
+STATUS_PHA_ONLY = "solo PhA (mancano altezza/età/sesso)"
+STATUS_INVALID = "non valida"
+
+def derived_name(version=FORMULA_VERSION):
+    return f"BIVA_DERIVED_{version}"
+
+def resolve_source_columns(header):
+    """Indice (0 = A) di ogni campo per intestazione, None se la colonna non c'è"""
+    low = [str(h).strip().lower() for h in header]
+    def find(*names):
+        return next((low.index(n) for n in names if n in low), None)
+    cols = {
+        "date": find("data", "date"), "name": find(*PATIENT_HEADERS),
+        "weight": find("peso", "weight"), "rz": find("rz"), "xc": find("xc"),
+        "height": find("altezza", "height"), "age": find("eta", "età", "age"), "sex": find("sesso", "sex", "gender"),
+    }
+    return cols
+
+def compute_chunk(numbered_rows, cols):
+    """Coppie (numero di riga nel foglio, riga grezza di BIVA_LOGS) -> righe del tab derivato (eseguita nei processi del pool)"""
+    width = max(cols[k] for k in cols if cols[k] is not None) + 1
+    row_nums = [n for n, _ in numbered_rows]
+    df = pd.DataFrame([list(r) + [""] * (width - len(r)) for _, r in numbered_rows])
+    def text(key):
+        return df[cols[key]].astype(str).str.strip() if cols[key] is not None else pd.Series("", index=df.index)
+    def number(key):
+        return to_float_column(df[cols[key]]) if cols[key] is not None else pd.Series(0.0, index=df.index)
+
+    rz, xc, weight, height, age = number("rz"), number("xc"), number("weight"), number("height"), number("age")
+    sex = text("sex").str.upper().str[:1]
+    complete = (height > 0) & (age > 0) & sex.isin(["M", "F"])
+
+    # Senza altezza/età/sesso si può comunque ricalcolare il PhA (dipende solo da Rz e Xc)
+    out = calculate_advanced_metrics_batch(rz, xc, height.where(complete, 100.0), weight.where(complete, 1.0),
+                                           age.where(complete, 0.0), sex.where(complete, "F"))
+    status = np.where(~out["valid"], STATUS_INVALID, np.where(complete, STATUS_OK, STATUS_PHA_ONLY))
+    values = out[METRICS].astype(object)
+    values.loc[~complete.to_numpy(), [m for m in METRICS if m != "PhA"]] = ""
+    values = values.where(pd.notna(values), "")
+
+    derived = pd.DataFrame({"Riga": row_nums, "Data": text("date"),
+                            "Paziente": text("name"), "Versione": FORMULA_VERSION, "Stato": status})
+    return pd.concat([derived, values], axis=1).values.tolist()
+
+def _last_row(table, cols):
+    """Ultima riga con dati in BIVA_LOGS (colonne chiave, una sola lettura)"""
+    keys = [cols[k] + 1 for k in ("date", "name", "rz") if cols[k] is not None]
+    return max((len(col) for col in table.get_columns(keys, 1)), default=1)
+
+def _read_chunks(table, start_row, chunk_size, last_row):
+    """Blocchi di coppie (numero di riga, riga) fino a 'last_row': le righe vuote si saltano, la numerazione resta quella del foglio"""
+    for row in range(start_row, last_row + 1, chunk_size):
+        rows = table.get_values(row, min(row + chunk_size - 1, last_row)) or []
+        numbered = [(row + i, r) for i, r in enumerate(rows) if any(str(v).strip() for v in r)]
+        if numbered: yield numbered
+
+def _resume_from(derived):
+    """Prima riga di BIVA_LOGS ancora da ricalcolare (dall'ultima 'Riga' del tab derivato)"""
+    riga = derived.col_values(1)
+    done = [int(v) for v in riga[1:] if str(v).strip().isdigit()]
+    return max(done) + 1 if done else 2
+
+def reprocess(backend, chunk_size=2000, workers=None, log=print):
+    """Ricalcola tutto BIVA_LOGS mancante nel tab derivato della versione corrente. Ritorna i conteggi per stato."""
+    source = backend.table(*SOURCE)
+    header = source.get_values(1, 1)
+    if not header: raise ValueError("BIVA_LOGS vuoto")
+    cols = resolve_source_columns(header[0])
+    for key in ("rz", "xc", "weight"):
+        if cols[key] is None: raise KeyError(f"Colonna '{key}' non trovata in BIVA_LOGS")
+
+    derived = backend.create_table(SOURCE[0], derived_name(), DERIVED_HEADERS)
+    start = _resume_from(derived)
+    workers = workers or os.cpu_count() or 2
+    log(f"Formule {FORMULA_VERSION} -> {derived_name()} · da riga {start} · {workers} processi · blocchi da {chunk_size}")
+
+    counts = {STATUS_OK: 0, STATUS_PHA_ONLY: 0, STATUS_INVALID: 0}
+    done, t0 = 0, time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        chunks = _read_chunks(source, start, chunk_size, _last_row(source, cols))
+        def write_oldest():
+            # Scrittura nell'ordine del foglio: se si interrompe, la ripresa riparte dall'ultima riga scritta
+            nonlocal done
+            rows = pending.popleft().result()
+            derived.append_rows(rows)
+            for r in rows: counts[r[4]] += 1
+            done += len(rows)
+            elapsed = max(time.time() - t0, 1e-9)
+            log(f"  {done} righe · {done / elapsed:,.0f} righe/s · fino alla riga {rows[-1][0]}")
+        for numbered in chunks:
+            pending.append(pool.submit(compute_chunk, numbered, cols))
+            if len(pending) >= workers * 2: write_oldest()
+        while pending: write_oldest()
+
+    elapsed = time.time() - t0
+    log(f"Fatto: {done} righe in {elapsed:.1f}s · complete {counts[STATUS_OK]} · "
+        f"solo PhA {counts[STATUS_PHA_ONLY]} · non valide {counts[STATUS_INVALID]}")
+    return counts
+
+if __name__ == "__main__":
+    from modules.backends import SheetsBackend, SQLiteBackend
+    parser = argparse.ArgumentParser(description="Ricalcola BIVA_LOGS con le formule attuali")
+    parser.add_argument("--backend", choices=["sheets", "sqlite"], default="sheets")
+    parser.add_argument("--path", default="store.sqlite", help="database del backend sqlite")
+    parser.add_argument("--chunk", type=int, default=2000, help="righe per blocco (lettura, calcolo e scrittura)")
+    parser.add_argument("--workers", type=int, default=None, help="processi di calcolo (default: un per core)")
+    args = parser.parse_args()
+    backend = SQLiteBackend(args.path) if args.backend == "sqlite" else SheetsBackend()
+    try: reprocess(backend, args.chunk, args.workers)
+    except (KeyError, ValueError) as e: sys.exit(f"Errore: {e}")
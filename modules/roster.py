@@ -0,0 +1,98 @@
+import time
+import threading
+from modules.mirror import normalize_name
+
+# ==============================================================================
+# ROSTER ATLETI (selectbox del coach)
+# Dal modulo anamnesi scarica SOLO le colonne email/nome, e ad ogni aggiornamento
+# solo le righe arrivate dopo l'ultima lettura. Ricerca "mentre scrivi" in memoria.
+# ==============================================================================
+
+EMAIL_HEADERS = ["e-mail", "email"]
+NAME_HEADERS = ["nome e cognome", "nome", "name"]
+SURNAME_HEADERS = ["cognome", "surname"]
+
+class Roster:
+    def __init__(self, refresh_every=60, rebuild_every=3600):
+        self.refresh_every = refresh_every  # Secondi tra due letture incrementali
+        self.rebuild_every = rebuild_every  # Rilettura completa periodica (righe corrette/cancellate a mano)
+        self.lock = threading.Lock()
+        self.columns = None     # (col email, col nome, col cognome) - 1 = A, None se assente
+        self.high_water = 1     # Ultima riga letta (1 = intestazione)
+        self.data = ({}, {})    # (email -> nome visualizzato, email -> testo normalizzato): sostituiti in blocco
+        self.last_refresh = 0.0
+        self.last_rebuild = 0.0
+
+    @property
+    def entries(self):
+        return self.data[0]
+
+    def _resolve_columns(self, header):
+        low = [str(h).strip().lower() for h in header]
+        def find(names):
+            for name in names:
+                if name in low: return low.index(name) + 1
+            return None
+        return find(EMAIL_HEADERS), find(NAME_HEADERS), find(SURNAME_HEADERS)
+
+    def refresh(self, table, force=False):
+        """
+        Legge le righe nuove (al più una volta ogni 'refresh_every' secondi, salvo force).
+        Si costruisce su copie locali: se la lettura fallisce resta il roster precedente.
+        """
+        now = time.time()
+        with self.lock:
+            if not force and now - self.last_refresh < self.refresh_every: return
+            rebuild = now - self.last_rebuild > self.rebuild_every
+            columns = None if rebuild else self.columns
+            high_water = 1 if rebuild else self.high_water
+
+            if columns is None:
+                header = table.get_values(1, 1)
+                if not header: return
+                columns = self._resolve_columns(header[0])
+            email_col, name_col, surname_col = columns
+            if email_col is None: raise KeyError("Colonna E-mail non trovata")
+
+            wanted = [c for c in columns if c is not None]
+            fetched = dict(zip(wanted, table.get_columns(wanted, high_water + 1)))
+            n_rows = max((len(v) for v in fetched.values()), default=0)
+
+            def cell(col, i):
+                values = fetched.get(col, [])
+                return str(values[i]).strip() if col is not None and i < len(values) else ""
+
+            entries, keys = ({}, {}) if rebuild else (dict(self.data[0]), dict(self.data[1]))
+            for i in range(n_rows):
+                email = cell(email_col, i).lower()
+                if not email or email == 'none': continue
+                name = " ".join(p for p in (cell(name_col, i), cell(surname_col, i)) if p)
+                if name or email not in entries:
+                    entries[email] = name
+                    keys[email] = normalize_name(f"{email} {name}")
+
+            # Lettura riuscita: tutto lo stato cambia insieme (search legge 'data' in un colpo solo)
+            self.columns, self.high_water = columns, high_water + n_rows
+            self.data = (entries, keys)
+            self.last_refresh = now
+            if rebuild: self.last_rebuild = now
+
+    def emails(self):
+        return sorted(self.data[0])
+
+    def label(self, email):
+        name = self.data[0].get(email, "")
+        return f"{email} — {name}" if name else email
+
+    def search(self, query, limit=None):
+        """Email o nome che contengono il testo; prima chi inizia con il testo"""
+        q = normalize_name(query)
+        entries, keys = self.data
+        if not q: return sorted(entries)[:limit]
+        starts, contains = [], []
+        for email in sorted(entries):
+            key = keys.get(email, email)
+            name_key = normalize_name(entries.get(email, ""))
+            if email.startswith(q) or name_key.startswith(q): starts.append(email)
+            elif q in key: contains.append(email)
+        return (starts + contains)[:limit]
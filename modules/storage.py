@@ -1,55 +1,80 @@
-import gspread
-from google.oauth2.service_account import Credentials
 import pandas as pd
 import streamlit as st
 import datetime
-import re
-
-def get_client():
-    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    creds_dict = dict(st.secrets["gcp_service_account"])
-    creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-    return gspread.authorize(creds)
-
-def clean_float(value):
-    """Pulisce i numeri da virgole e %"""
-    if value is None: return 0.0
-    s_val = str(value).replace(',', '.')
-    # Toglie tutto quello che non è numero o punto (es. "18.5%" -> "18.5")
-    s_val = re.sub(r'[^\d\.-]', '', s_val)
-    try:
-        return float(s_val)
-    except:
-        return 0.0
+import json
+from modules import mirror, plan_codec, plan_index, write_queue
+from modules.backends import get_backend, SheetsBackend, sync_to_sheets
+from modules.ingest import to_float_column
+
+BIVA_LOGS = "AREA199_DB/BIVA_LOGS" # Chiave del mirror locale
+PATIENT_HEADERS = ["paziente", "nome", "soggetto", "name"] # Colonne ammesse per il nome paziente (indicizzata)
+BIVA_EXTRA_COLUMNS = ["Altezza", "Eta", "Sesso"] # Scritte da save_visit nella colonna con quell'intestazione
+
+def _record_biva_rows(first_row, rows):
+    # Righe appena scritte dalla coda -> mirror + indice pazienti, senza riscaricarle
+    mirror.record_append(BIVA_LOGS, first_row, rows, PATIENT_HEADERS)
+
+write_queue.on_flush("AREA199_DB", "BIVA_LOGS", _record_biva_rows)
+
+PLANS = "AREA199_DB/SCHEDE_ATTIVE" # Chiave dell'indice email -> ultima scheda
+PLAN_JSON_COLUMNS = ("JSON_Completo", "JSON_Scheda", "JSON_Dieta") # Colonne in formato compatto (plan_codec)
+
+def _record_plan_rows(first_row, rows):
+    # Schede appena inviate dal coach -> puntatore all'ultima riga per email
+    plan_index.record_append(PLANS, first_row, rows)
+
+write_queue.on_flush("AREA199_DB", "SCHEDE_ATTIVE", _record_plan_rows)
+
+def get_table(spreadsheet, worksheet=None):
+    """Tabella sul backend attivo (Google Sheets o SQLite locale)"""
+    return get_backend().table(spreadsheet, worksheet)
+
+def start_queue():
+    """
+    Avvia il thread della coda verso Google Sheets (se il backend lo prevede).
+    Chiamata all'avvio dell'app: le righe rimaste da un riavvio partono senza aspettare il prossimo salvataggio.
+    """
+    backend = get_backend()
+    if backend.name == "sheets": write_queue.start_flusher(backend.table)
+    elif sync_to_sheets(): write_queue.start_flusher(SheetsBackend().table, notify=False)
+
+def queue_row(spreadsheet, worksheet, row):
+    """
+    Scrive una riga ritornando subito.
+    Backend Sheets: coda locale + invio a Google in background.
+    Backend SQLite: scrittura locale immediata (+ replica su Sheets in coda, se 'sync_to_sheets').
+    """
+    backend = get_backend()
+    if backend.name == "sheets":
+        write_queue.enqueue(spreadsheet, worksheet, row)
+        start_queue()
+        return
+
+    first_row = backend.table(spreadsheet, worksheet).append_rows([row])
+    write_queue.notify(spreadsheet, worksheet, first_row, [row])
+    if sync_to_sheets():
+        # Sheets è solo destinazione di replica: i numeri di riga non riguardano mirror/indici locali
+        write_queue.enqueue(spreadsheet, worksheet, row)
+        start_queue()
+
+def suggest_patients(patient_name):
+    """Pazienti in archivio con nome simile (refusi, nome/cognome invertiti): da confermare a video"""
+    try: return mirror.suggest(BIVA_LOGS, patient_name, PATIENT_HEADERS)
+    except Exception: return []
 
 def get_patient_history(patient_name):
     """Recupera lo storico mappando ESATTAMENTE le tue colonne"""
     try:
-        client = get_client()
-        sh = client.open("AREA199_DB")
-        worksheet = sh.worksheet("BIVA_LOGS")
+        # Scarica solo le righe nuove; se Google non risponde si usa la copia locale
+        try: mirror.sync(BIVA_LOGS, get_table("AREA199_DB", "BIVA_LOGS"), PATIENT_HEADERS)
+        except Exception: pass
         
-        data = worksheet.get_all_values()
-        if not data or len(data) < 2: return pd.DataFrame()
+        # Una lettura dell'indice nome -> righe (solo nome identico a meno di accenti/maiuscole/spazi)
+        headers, rows = mirror.lookup(BIVA_LOGS, patient_name)
+        if not headers or not rows: return pd.DataFrame()
             
-        # Intestazioni originali (senza toccarle troppo, solo strip)
-        headers = [str(h).strip() for h in data[0]] 
-        rows = data[1:]
-        df = pd.DataFrame(rows, columns=headers)
-        
-        # Cerca la colonna Paziente (flessibile sul nome colonna paziente)
-        col_name = None
-        for c in df.columns:
-            if c.lower() in ["paziente", "nome", "soggetto", "name"]:
-                col_name = c
-                break
-        if not col_name: return pd.DataFrame()
-
-        # Filtra per nome paziente
-        target_name = patient_name.strip().lower()
-        df_filtered = df[df[col_name].astype(str).str.strip().str.lower() == target_name].copy()
-        
-        if df_filtered.empty: return pd.DataFrame()
+        # Intestazioni originali (il mirror fa solo lo strip)
+        df_filtered = pd.DataFrame(rows, columns=headers)
 
         # --- MAPPA ESATTA: TUE COLONNE -> CHIAVI SISTEMA ---
         # Sinistra: Chiave che usa il PDF / Destra: Nome esatto nel tuo Excel/Drive
@@ -80,7 +105,7 @@ def get_patient_history(patient_name):
                 if pdf_key == 'Data':
                     final_df[pdf_key] = df_filtered[found_col]
                 else:
-                    final_df[pdf_key] = df_filtered[found_col].apply(clean_float)
+                    final_df[pdf_key] = to_float_column(df_filtered[found_col]).values
             else:
                 # Se manca la colonna, metti 0.0
                 if pdf_key != 'Data':
@@ -95,12 +120,32 @@ def get_patient_history(patient_name):
     except Exception as e:
         return pd.DataFrame()
 
-def save_visit(name, weight, rz, xc, pha, tbw, fm_perc, ffm_kg):
+def _ensure_headers(table, names):
+    """Intestazioni del tab, aggiungendo in coda (una volta sola) quelle di 'names' che mancano"""
+    found = table.get_values(1, 1)
+    headers = [str(h).strip() for h in found[0]] if found else []
+    while headers and not headers[-1]: headers.pop()
+    low = [h.lower() for h in headers]
+    missing = [n for n in names if n.lower() not in low]
+    if headers and missing:
+        headers += missing
+        table.set_headers(headers)
+    return headers
+
+def _biva_headers():
+    """Intestazioni di BIVA_LOGS con le colonne BIVA_EXTRA_COLUMNS garantite (letta dal foglio solo se mancano nel mirror)"""
+    headers = mirror.headers(BIVA_LOGS)
+    low = [h.lower() for h in headers]
+    if all(c.lower() in low for c in BIVA_EXTRA_COLUMNS): return headers
+    headers = _ensure_headers(get_table("AREA199_DB", "BIVA_LOGS"), BIVA_EXTRA_COLUMNS)
+    if get_backend().name != "sheets" and sync_to_sheets():
+        try: _ensure_headers(SheetsBackend().table("AREA199_DB", "BIVA_LOGS"), BIVA_EXTRA_COLUMNS)
+        except Exception: pass
+    mirror.reset(BIVA_LOGS) # Intestazione cambiata: il mirror si riallinea alla prossima sync
+    return headers
+
+def save_visit(name, weight, rz, xc, pha, tbw, fm_perc, ffm_kg, height=None, age=None, gender=None):
     try:
-        client = get_client()
-        sh = client.open("AREA199_DB")
-        worksheet = sh.worksheet("BIVA_LOGS")
-        
         date_str = datetime.datetime.now().strftime("%d/%m/%Y")
         
         # Ordine ESATTO delle colonne che mi hai dato:
@@ -116,9 +161,36 @@ def save_visit(name, weight, rz, xc, pha, tbw, fm_perc, ffm_kg):
             str(fm_perc).replace('.', ','), 
             str(ffm_kg).replace('.', ',')
         ]
+        # Dati per ricalcolare la visita con formule nuove: nella colonna con la loro intestazione
+        if height is not None:
+            headers = [h.lower() for h in _biva_headers()]
+            extra = dict(zip(BIVA_EXTRA_COLUMNS, [str(height).replace('.', ','), str(int(age)) if age is not None else "", gender or ""]))
+            positions = {headers.index(c.lower()): v for c, v in extra.items() if c.lower() in headers}
+            if positions:
+                row += [""] * (max(positions) + 1 - len(row))
+                for pos, value in positions.items(): row[pos] = value
         
-        worksheet.append_row(row)
+        queue_row("AREA199_DB", "BIVA_LOGS", row)
         return True
     except Exception as e:
         st.error(f"Errore salvataggio: {e}")
         return False
+
+def get_latest_plan(email):
+    """
+    Ultima scheda inviata all'atleta ({colonna: valore}) o None: legge una sola riga di SCHEDE_ATTIVE.
+    I JSON compressi (e spezzati su più celle) tornano in chiaro; le righe vecchie passano invariate.
+    """
+    found = plan_index.latest(PLANS, get_table("AREA199_DB", "SCHEDE_ATTIVE"), email)
+    if not found: return None
+    headers, row = found
+    return plan_codec.decode_record(headers, row, PLAN_JSON_COLUMNS)
+
+def save_plan(email, full_name, comment, plan_json, diet_json):
+    """Accoda l'invio di scheda + dieta: JSON compressi, spezzati in più celle solo se superano il limite"""
+    json_w = json.dumps(plan_json) if plan_json else ""
+    json_d = json.dumps(diet_json) if diet_json else ""
+    # Celle di continuazione dopo l'ultima intestazione nota (mai sotto un'altra colonna)
+    row = plan_codec.encode_row([datetime.datetime.now().strftime("%Y-%m-%d"), email, full_name, comment], [json_w, json_d],
+                                len(plan_index.headers(PLANS)))
+    queue_row("AREA199_DB", "SCHEDE_ATTIVE", row)
@@ -0,0 +1,54 @@
+import time
+import threading
+from datetime import datetime
+
+# ==============================================================================
+# ABBONAMENTI (CLIENTI_ATTIVI) IN MEMORIA
+# email -> (scadenza testo, scadenza data, link pagamento), costruita una volta per
+# refresh e condivisa da tutte le sessioni. Ogni rerun dell'atleta è un accesso a dizionario.
+# ==============================================================================
+
+DATE_FORMAT = "%d/%m/%Y"
+
+class SubscriptionMap:
+    def __init__(self, ttl=300, recheck_after=30):
+        self.ttl = ttl                      # Secondi di validità della mappa
+        self.recheck_after = recheck_after  # Utente bloccato/assente: rilettura anticipata (rinnovi appena fatti)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.loaded_at = 0.0
+        self.forced = False                 # Rilettura richiesta (invalidate): la mappa resta valida finché non riesce
+
+    @property
+    def loaded(self):
+        return self.loaded_at > 0
+
+    def age(self):
+        return time.time() - self.loaded_at
+
+    def is_stale(self):
+        return self.forced or self.age() > self.ttl
+
+    def invalidate(self):
+        """La prossima richiesta rilegge il foglio (es. dopo un rinnovo); se la lettura fallisce resta l'ultima mappa"""
+        self.forced = True
+
+    def refresh(self, open_table, force=False):
+        """Rilegge CLIENTI_ATTIVI se scaduta (o force). open_table() -> tabella, chiamata solo se serve."""
+        with self.lock:
+            if not force and not self.is_stale(): return
+            entries = {}
+            for r in open_table().get_all_records():
+                email = str(r.get('Email')).strip().lower()
+                if email in entries: continue # Vale la prima riga, come la vecchia ricerca lineare
+                scadenza_str = str(r.get('Scadenza'))
+                try: scadenza_dt = datetime.strptime(scadenza_str, DATE_FORMAT)
+                except ValueError: scadenza_dt = None
+                entries[email] = (scadenza_str, scadenza_dt, str(r.get('Link_Pagamento', '')).strip())
+            self.entries = entries
+            self.loaded_at = time.time()
+            self.forced = False
+
+    def get(self, email):
+        """(scadenza testo, scadenza data o None se illeggibile, link) oppure None se l'email non c'è"""
+        return self.entries.get(str(email).strip().lower())
@@ -0,0 +1,123 @@
+import re
+import unicodedata
+
+# ==============================================================================
+# LETTURA LOCALE DELLA SCHEDA ALLENAMENTO (senza AI)
+# Formato abituale dei coach:
+#     Sessione A
+#     1. Panca piana 4x8 rec 90''
+#     Nota: fermo al petto
+# Produce lo stesso JSON del prompt "FOTOCOPIATRICE" (sessions/exercises/details/note).
+# Se anche una sola riga non è riconoscibile la scheda torna al percorso AI completo.
+# ==============================================================================
+
+DAYS = r"luned[iì]|marted[iì]|mercoled[iì]|gioved[iì]|venerd[iì]|sabato|domenica"
+SESSION_RE = re.compile(rf"^(?:sessione|seduta|giorno|allenamento|scheda|session|day|workout|training|{DAYS})\b", re.IGNORECASE)
+# Serie x ripetizioni ("4x8", "3 x 10-12", "3x30''", "4xMAX") oppure "3 serie da 10"
+SCHEME_RE = re.compile(r"(?<![\w])\d+\s*[x×]\s*(?:\d|max\b|amrap\b|cedimento\b)|(?<![\w])\d+\s*serie\b", re.IGNORECASE)
+NOTE_RE = re.compile(r"^(?:note?|nota|n\.?\s?b\.?)\s*[:.\-]|^(?:->|→|=>)|^\(.*\)$", re.IGNORECASE)
+BULLET_RE = re.compile(r"^(?:[-–•·>]+|\d+\s*[.)]|[a-z]\d*\s*[.)])\s*", re.IGNORECASE)
+MARKS = "#*=_ \t"
+
+# Italiano -> inglese per 'search_name' (frasi più lunghe prima). Il resto lo traduce l'AI in un'unica richiesta.
+GLOSSARY = {
+    "panca piana": "bench press", "panca inclinata": "incline bench press", "panca declinata": "decline bench press",
+    "distensioni": "press", "lento avanti": "military press", "lento dietro": "behind the neck press",
+    "alzate laterali": "lateral raise", "alzate frontali": "front raise", "alzate posteriori": "reverse fly",
+    "croci": "fly", "croci ai cavi": "cable crossover", "rematore": "row", "pulley": "seated cable row",
+    "trazioni": "pull-up", "trazioni alla sbarra": "pull-up", "lat machine": "lat pulldown",
+    "stacco rumeno": "romanian deadlift", "stacco da terra": "deadlift", "stacco": "deadlift",
+    "affondi": "lunge", "affondi bulgari": "bulgarian split squat", "pressa": "leg press",
+    "polpacci": "calf raise", "calf in piedi": "standing calf raise", "calf seduto": "seated calf raise",
+    "tirate al mento": "upright row", "scrollate": "shrug", "piegamenti": "push-up", "flessioni": "push-up",
+    "parallele": "dips", "addominali": "crunch", "spinte": "press",
+    "manubri": "dumbbell", "manubrio": "dumbbell", "bilanciere": "barbell", "cavi": "cable", "cavo": "cable",
+    "macchina": "machine", "multipower": "smith machine", "corda": "rope", "elastico": "band",
+    "in piedi": "standing", "seduto": "seated", "sdraiato": "lying", "su panca": "bench", "presa stretta": "close grip",
+    "presa inversa": "reverse grip", "a martello": "hammer", "al": "", "alla": "", "ai": "", "con": "", "su": "", "da": "", "di": "", "a": "",
+}
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode()
+    return " ".join(re.findall(r"[a-z0-9\-]+", text.lower()))
+
+def _strip_marks(line):
+    return line.strip().strip(MARKS).strip()
+
+def _classify(line):
+    """('session', nome) | ('exercise', (nome, dettagli)) | ('note', testo) | (None, riga)"""
+    text = _strip_marks(line)
+    body = BULLET_RE.sub("", text, count=1)
+    m = SCHEME_RE.search(body)
+    if m:
+        name = body[:m.start()].strip().rstrip(":-–,").strip()
+        if name and not SESSION_RE.match(name): return "exercise", (name, body[m.start():].strip())
+        return None, line
+    for candidate in (body, text): # "-> testo" perderebbe la freccia togliendo il punto elenco
+        if NOTE_RE.match(candidate): return "note", candidate
+    if SESSION_RE.match(text) or (text.endswith(":") and len(text) > 1) or line.lstrip().startswith("#"):
+        return "session", text.rstrip(":").strip()
+    return None, line
+
+def parse_workout(text):
+    """
+    Scheda -> (plan_json senza 'search_name', righe non riconosciute).
+    plan_json è None se non c'è nessun esercizio.
+    """
+    sessions, unknown = [], []
+    current, last = None, None
+    for line in str(text or "").splitlines():
+        if not line.strip() or not _strip_marks(line): continue
+        kind, value = _classify(line)
+        if kind == "session":
+            current, last = {"name": value, "exercises": []}, None
+            sessions.append(current)
+        elif kind == "exercise" and current is not None:
+            last = {"name": value[0], "search_name": "", "details": value[1], "note": ""}
+            current["exercises"].append(last)
+        elif kind == "note" and last is not None:
+            last["note"] = f"{last['note']} {value}".strip()
+        else:
+            unknown.append(line.strip())
+
+    sessions = [s for s in sessions if s["exercises"]]
+    if not sessions: return None, unknown
+    return {"sessions": sessions}, unknown
+
+def translate_name(name, vocabulary):
+    """Nome in inglese via glossario; None se restano parole sconosciute (le traduce l'AI)"""
+    words = normalize(name).split()
+    out, i = [], 0
+    phrases = sorted(GLOSSARY, key=lambda k: len(k.split()), reverse=True)
+    while i < len(words):
+        for phrase in phrases:
+            n = len(phrase.split())
+            if words[i:i + n] == phrase.split():
+                if GLOSSARY[phrase]: out.append(GLOSSARY[phrase])
+                i += n
+                break
+        else:
+            if words[i] not in vocabulary: return None
+            out.append(words[i])
+            i += 1
+    return " ".join(out) or None
+
+def fill_search_names(plan_json, vocabulary, translate_batch):
+    """
+    Imposta 'search_name' su tutti gli esercizi: glossario/nomi già inglesi in locale,
+    gli altri con UNA sola chiamata translate_batch(lista nomi) -> lista nomi inglesi.
+    """
+    exercises = [ex for s in plan_json.get("sessions", []) for ex in s.get("exercises", [])]
+    missing = []
+    for ex in exercises:
+        ex["search_name"] = translate_name(ex["name"], vocabulary) or ""
+        if not ex["search_name"]: missing.append(ex)
+
+    if missing:
+        names = list(dict.fromkeys(ex["name"] for ex in missing))
+        try:
+            translated = dict(zip(names, translate_batch(names)))
+        except Exception:
+            translated = {}
+        for ex in missing: ex["search_name"] = str(translated.get(ex["name"]) or ex["name"])
+    return plan_json
@@ -0,0 +1,162 @@
+import json
+import os
+import time
+import random
+import datetime
+import threading
+from modules.local_db import open_db
+
+# ==============================================================================
+# CODA DI SCRITTURA (WRITE-BEHIND)
+# Le righe vengono prima salvate su disco (SQLite) e il click ritorna subito.
+# Un thread di processo le invia a blocchi con append_rows, ritentando con
+# backoff esponenziale su quota (429) ed errori temporanei di Google (5xx).
+# ==============================================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS write_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    spreadsheet TEXT NOT NULL,
+    worksheet TEXT NOT NULL,
+    row TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    claimed_at REAL,
+    failed INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+"""
+
+BATCH_DELAY = 2.0       # Secondi di attesa per raggruppare i click ravvicinati in un'unica chiamata
+MAX_BATCH = 200         # Righe massime per append_rows
+MAX_BACKOFF = 60.0      # Tetto del backoff (secondi)
+CLAIM_TIMEOUT = 300     # Un blocco "preso" da un worker morto torna disponibile dopo 5 minuti
+
+_hooks = {}
+_wake = threading.Event()
+_flusher = None
+_flusher_lock = threading.Lock()
+_worker_id = f"{os.getpid()}-{id(_wake)}"
+
+def on_flush(spreadsheet, worksheet, fn):
+    """Registra fn(first_row, rows), chiamata dopo ogni blocco scritto su quel foglio"""
+    _hooks[(spreadsheet, worksheet)] = fn
+
+def enqueue(spreadsheet, worksheet, row):
+    """Salva la riga in coda (durevole) e sveglia il thread di invio"""
+    with open_db(SCHEMA) as conn:
+        conn.execute("INSERT INTO write_queue (spreadsheet, worksheet, row, created_at) VALUES (?, ?, ?, ?)",
+                     (spreadsheet, worksheet, json.dumps(row), datetime.datetime.now().isoformat()))
+    _wake.set()
+
+def pending_count():
+    """Righe ancora da inviare (esclude quelle scartate da Google come non valide)"""
+    with open_db(SCHEMA) as conn:
+        return conn.execute("SELECT COUNT(*) FROM write_queue WHERE failed = 0").fetchone()[0]
+
+def failed_rows():
+    """Righe scartate da Google come non valide (4xx): [(id, foglio, tab, riga, errore, creata il)]"""
+    with open_db(SCHEMA) as conn:
+        cur = conn.execute("SELECT id, spreadsheet, worksheet, row, last_error, created_at FROM write_queue "
+                           "WHERE failed = 1 ORDER BY id")
+        return [(i, sh, ws, json.loads(row), err or "", created) for i, sh, ws, row, err, created in cur.fetchall()]
+
+def retry_failed(ids=None):
+    """Rimette in coda le righe scartate (tutte o solo 'ids'), ad es. dopo aver sistemato il foglio"""
+    with open_db(SCHEMA) as conn:
+        if ids is None: conn.execute("UPDATE write_queue SET failed = 0, attempts = 0 WHERE failed = 1")
+        else: conn.executemany("UPDATE write_queue SET failed = 0, attempts = 0 WHERE id = ? AND failed = 1", [(i,) for i in ids])
+    _wake.set()
+
+def discard_failed(ids=None):
+    """Elimina definitivamente le righe scartate (tutte o solo 'ids')"""
+    with open_db(SCHEMA) as conn:
+        if ids is None: conn.execute("DELETE FROM write_queue WHERE failed = 1")
+        else: conn.executemany("DELETE FROM write_queue WHERE id = ? AND failed = 1", [(i,) for i in ids])
+
+def _claim_batch():
+    """Prende in carico il blocco più vecchio di un solo foglio (atomico anche tra più processi)"""
+    now = time.time()
+    with open_db(SCHEMA) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        first = conn.execute(
+            "SELECT spreadsheet, worksheet FROM write_queue WHERE failed = 0 "
+            "AND (claimed_by IS NULL OR claimed_at < ?) ORDER BY id LIMIT 1", (now - CLAIM_TIMEOUT,)).fetchone()
+        if not first: return None
+        cur = conn.execute(
+            "SELECT id, row FROM write_queue WHERE failed = 0 AND spreadsheet = ? AND worksheet = ? "
+            "AND (claimed_by IS NULL OR claimed_at < ?) ORDER BY id LIMIT ?",
+            (first[0], first[1], now - CLAIM_TIMEOUT, MAX_BATCH))
+        items = cur.fetchall()
+        conn.executemany("UPDATE write_queue SET claimed_by = ?, claimed_at = ? WHERE id = ?",
+                         [(_worker_id, now, i) for i, _ in items])
+    return first[0], first[1], [i for i, _ in items], [json.loads(r) for _, r in items]
+
+def _release(ids, error, failed=False):
+    with open_db(SCHEMA) as conn:
+        conn.executemany(
+            "UPDATE write_queue SET claimed_by = NULL, claimed_at = NULL, attempts = attempts + 1, "
+            "last_error = ?, failed = ? WHERE id = ?", [(str(error)[:500], int(failed), i) for i in ids])
+
+def _is_retryable(e):
+    """429 e 5xx (o errori di rete senza risposta) si ritentano; gli altri 4xx no"""
+    status = getattr(getattr(e, 'response', None), 'status_code', None)
+    return status is None or status == 429 or status >= 500
+
+def notify(spreadsheet, worksheet, first_row, rows):
+    """Avvisa l'hook registrato per quel foglio (errori dell'hook ignorati: la scrittura è già avvenuta)"""
+    hook = _hooks.get((spreadsheet, worksheet))
+    if hook and first_row:
+        try: hook(first_row, rows)
+        except Exception: pass
+
+def flush(open_table, notify_hooks=True):
+    """
+    Invia tutta la coda, un blocco per foglio alla volta. Ritorna il numero di righe scritte.
+    open_table(spreadsheet, worksheet) -> tabella del backend (vedi modules.backends).
+    Su errore temporaneo rilascia il blocco e rilancia l'eccezione (il chiamante gestisce il backoff).
+    """
+    written = 0
+    while True:
+        batch = _claim_batch()
+        if not batch: return written
+        spreadsheet, worksheet, ids, rows = batch
+        try:
+            first_row = open_table(spreadsheet, worksheet).append_rows(rows)
+        except Exception as e:
+            retry = _is_retryable(e)
+            _release(ids, e, failed=not retry)
+            if retry: raise
+            continue
+
+        with open_db(SCHEMA) as conn:
+            conn.executemany("DELETE FROM write_queue WHERE id = ?", [(i,) for i in ids])
+        written += len(rows)
+        if notify_hooks: notify(spreadsheet, worksheet, first_row, rows)
+
+def _run(open_table, notify_hooks):
+    backoff = 1.0
+    _wake.set() # Al primo avvio svuota eventuali righe rimaste da un riavvio
+    while True:
+        _wake.wait(timeout=30)
+        _wake.clear()
+        time.sleep(BATCH_DELAY)
+        try:
+            flush(open_table, notify_hooks)
+            backoff = 1.0
+        except Exception:
+            time.sleep(backoff + random.uniform(0, backoff / 2))
+            backoff = min(backoff * 2, MAX_BACKOFF)
+            _wake.set()
+
+def start_flusher(open_table, notify=True):
+    """
+    Avvia (una volta per processo) il thread che svuota la coda.
+    notify=False quando il foglio è solo una replica: gli hook seguono il backend principale.
+    """
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_run, args=(open_table, notify), name="area199-write-queue", daemon=True)
+            _flusher.start()